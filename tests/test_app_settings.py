@@ -0,0 +1,21 @@
+"""Тесты сохранения настроек (app_settings.py)."""
+from tirika_importer.app_settings import AppSettings, load_app_settings, save_app_settings
+
+
+def test_save_and_load_roundtrip(tmp_path, monkeypatch):
+    monkeypatch.setenv("APPDATA", str(tmp_path))
+    settings = AppSettings(db_path="C:/Tirika/shop.db", markup_percent=35.0, shop_id=7)
+    path = save_app_settings(settings)
+    assert path == tmp_path / "Dazzle" / "settings.json"
+    loaded = load_app_settings()
+    assert loaded.db_path == "C:/Tirika/shop.db"
+    assert loaded.markup_percent == 35.0
+    assert loaded.shop_id == 7
+
+
+def test_save_replaces_file_without_leftovers(tmp_path, monkeypatch):
+    monkeypatch.setenv("APPDATA", str(tmp_path))
+    save_app_settings(AppSettings(shop_id=1))
+    path = save_app_settings(AppSettings(shop_id=2))
+    assert load_app_settings().shop_id == 2
+    assert sorted(p.name for p in path.parent.iterdir()) == ["settings.json"]
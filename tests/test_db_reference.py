@@ -0,0 +1,32 @@
+"""Тесты чтения справочников базы (db.py) на временной SQLite."""
+import sqlite3
+
+from tirika_importer.db import TirikaDB
+
+
+def _make_db(path):
+    conn = sqlite3.connect(path)
+    conn.executescript(
+        """
+        CREATE TABLE suppliers (id INTEGER, name TEXT, is_deleted INTEGER);
+        CREATE TABLE users (id INTEGER, name TEXT, is_deleted INTEGER);
+        CREATE TABLE settings (settings_name TEXT, settings_value TEXT);
+        INSERT INTO suppliers VALUES (2, 'Микадо', 0), (1, 'Армтек', 0), (3, 'Старый', 1);
+        INSERT INTO users VALUES (1, 'Админ', 0), (2, 'Удалён', 1);
+        INSERT INTO settings VALUES ('SHOP COUNT', '2'), ('SHOP 1', '1,Склад'), ('SHOP 2', '2,Озон');
+        """
+    )
+    conn.commit()
+    conn.close()
+
+
+def test_list_reference_data_matches_separate_queries(tmp_path):
+    path = tmp_path / "shop.db"
+    _make_db(path)
+    db = TirikaDB(path)
+
+    suppliers, users, shops = db.list_reference_data()
+
+    assert suppliers == db.list_suppliers() == [(1, "Армтек"), (2, "Микадо")]
+    assert users == db.list_users() == [(1, "Админ")]
+    assert shops == db.list_shops() == [(1, "Склад"), (2, "Озон")]
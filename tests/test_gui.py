@@ -0,0 +1,56 @@
+"""Тесты расчётов окна накладной (gui.py) без создания виджетов."""
+import copy
+
+import pytest
+
+from tirika_importer.app_settings import AppSettings
+from tirika_importer.db import GoodRecord
+from tirika_importer.matcher import GoodsMatcher
+from tirika_importer.models import InvoiceLine
+
+gui = pytest.importorskip("tirika_importer.gui", reason="Qt-биндинги недоступны")
+
+
+class _PriceStateHost:
+    """Минимальный «self» для методов MainWindow, считающих цены продажи."""
+
+    _update_line_sell_state = gui.MainWindow._update_line_sell_state
+    _refresh_line_price_state = gui.MainWindow._refresh_line_price_state
+    _refresh_all_line_price_states = gui.MainWindow._refresh_all_line_price_states
+
+    def __init__(self, matcher: GoodsMatcher) -> None:
+        self.matcher = matcher
+        self.app_settings = AppSettings()
+
+
+def _good(gid, sell_price):
+    return GoodRecord(gid, f"CODE{gid}", f"Товар {gid}", "", 0.0, sell_price, 0, 0)
+
+
+def test_bulk_price_state_matches_per_line_refresh():
+    host = _PriceStateHost(GoodsMatcher({1: _good(1, 300.0), 2: _good(2, 0.0)}))
+    lines = []
+    for price, good_id, sell in (
+        (100.0, 1, None),
+        (float("nan"), 1, None),  # пустая ячейка цены в Excel
+        (float("nan"), None, None),
+        (250.0, 2, None),
+        (float("nan"), 2, 120.0),
+        (180.0, None, 180.0),
+        (-5.0, 1, None),
+    ):
+        line = InvoiceLine(1, "A", "N", "", 1.0, price, 0.0, "S", sell_price=sell)
+        line.matched_good_id = good_id
+        lines.append(line)
+
+    bulk = copy.deepcopy(lines)
+    host._refresh_all_line_price_states(bulk)
+    single = copy.deepcopy(lines)
+    for line in single:
+        host._refresh_line_price_state(line)
+
+    def state(x):
+        return (x.sell_price, x.suggested_sell_price, x.sell_price_diff_percent, x.price_alert)
+
+    assert [state(x) for x in bulk] == [state(x) for x in single]
+    assert bulk[1].sell_price == 0.0  # NaN-закупка не превращается в цену продажи «nan»
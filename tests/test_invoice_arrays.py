@@ -0,0 +1,68 @@
+"""Тесты колоночного представления накладной (invoice_arrays.py)."""
+import math
+
+import numpy as np
+
+from tirika_importer.db import calculate_suggested_sell_price
+from tirika_importer.invoice_arrays import InvoiceArrays, sell_price_diff_percents, suggested_sell_prices
+from tirika_importer.models import InvoiceLine
+
+
+def line(qty, price, total, sell=None):
+    return InvoiceLine(1, "A", "N", "", qty, price, total, "S", sell_price=sell)
+
+
+def test_from_lines_columns():
+    arrays = InvoiceArrays.from_lines([line(2, 10, 20, sell=15), line(3, 5, 0)])
+    assert arrays.qty.tolist() == [2.0, 3.0]
+    assert arrays.buy.tolist() == [10.0, 5.0]
+    assert arrays.sell[0] == 15.0 and math.isnan(arrays.sell[1])
+    # сумма без total считается как qty * buy
+    assert arrays.sum.tolist() == [20.0, 15.0]
+
+
+def test_totals():
+    arrays = InvoiceArrays.from_lines([line(2, 10, 25), line(-1, 5, 0)])
+    assert arrays.total_qty() == 2.0  # отрицательное кол-во в итог не входит
+    assert arrays.total_sum() == 20.0
+    assert len(arrays) == 2
+
+
+def test_update_rows_matches_rebuild():
+    lines = [line(2, 10, 20, sell=15), line(3, 5, 0), line(1, 7, 7)]
+    arrays = InvoiceArrays.from_lines(lines)
+    lines[1].quantity = 4
+    lines[1].sell_price = 9
+    lines[2].total = 0
+    arrays.update_rows(lines, [1, 2, 5])
+    expected = InvoiceArrays.from_lines(lines)
+    for name in ("qty", "buy", "sell", "sum"):
+        assert np.array_equal(getattr(arrays, name), getattr(expected, name), equal_nan=True)
+
+
+def test_empty():
+    arrays = InvoiceArrays.from_lines([])
+    assert len(arrays) == 0
+    assert arrays.total_qty() == 0.0
+    assert arrays.total_sum() == 0.0
+
+
+def test_suggested_sell_prices_matches_scalar():
+    buy = [0, 1, 99.99, 100, 120, 133.33, -10, 1e6 + 0.01, float("nan")]
+    for markup, step in ((50, 50), (75, 10), (30, 0), (12.5, 0.5)):
+        got = suggested_sell_prices(buy, markup_percent=markup, round_step=step).tolist()
+        expected = [calculate_suggested_sell_price(x, markup_percent=markup, round_step=step) for x in buy]
+        assert got == expected
+
+
+def test_sell_price_diff_percents():
+    existing = [100, 100, 0, 0, 33.3, -5]
+    sell = [150, 80, 10, 0, 33.3, 0]
+    got = sell_price_diff_percents(existing, sell).tolist()
+    expected = []
+    for e, x in zip(existing, sell):
+        if e <= 0:
+            expected.append(100.0 if x > 0 else 0.0)
+        else:
+            expected.append(abs(x - e) / e * 100.0)
+    assert got == expected
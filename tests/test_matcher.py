@@ -1,9 +1,11 @@
 """Тесты сопоставления товаров (matcher.py)."""
+from difflib import SequenceMatcher
+
 import pytest
 
 from tirika_importer.db import GoodRecord
-from tirika_importer.matcher import GoodsMatcher, build_article_variants, normalize_name
-from tirika_importer.models import InvoiceLine
+from tirika_importer.matcher import GoodsMatcher, build_article_variants, normalize_code_alnum, normalize_name
+from tirika_importer.models import LINE_FLAG_MANUAL_EDITED, LINE_FLAG_SELL_INITIALIZED, InvoiceLine
 
 
 def good(gid, code, name, **kw):
@@ -88,6 +90,63 @@ def test_name_fallback():
     assert ln.match_status == "fuzzy"
 
 
+def test_find_by_name_matches_full_scan():
+    names = [
+        "Фильтр масляный Toyota", "Фильтр воздушный Toyota", "Фильтр салонный",
+        "Фильтр масляный", "Масляный фильтр Mann", "Фильтр", "Свеча зажигания Bosch",
+        "Фильтр масляный Toyota Camry оригинал", "Фильтр топливный Toyota",
+    ]
+    m = GoodsMatcher({i: good(i, f"C{i}", n) for i, n in enumerate(names, start=1)})
+    target = normalize_name("фильтр масляный toyota")
+    tokens = target.split()
+    expected = []
+    for gid, n in enumerate(names, start=1):
+        norm = normalize_name(n)
+        hits = sum(1 for t in tokens if t in norm)
+        if hits:
+            ratio = SequenceMatcher(None, target, norm).ratio()
+            expected.append((round(hits / len(tokens) * 0.65 + ratio * 0.35, 4), gid))
+    expected.sort(key=lambda x: x[0], reverse=True)
+    for limit in (1, 3, 8):
+        got = [(c.score, c.good_id) for c in m._find_by_name("Фильтр масляный Toyota", limit=limit)]
+        assert got == expected[:limit]
+
+
+def test_find_by_name_matches_token_inside_word():
+    m = GoodsMatcher({
+        1: good(1, "A", "Фильтры масляные"),
+        2: good(2, "B", "Свеча зажигания"),
+        3: good(3, "C", ""),
+    })
+    # токен ищется как подстрока слова названия, а не как целое слово
+    assert [c.good_id for c in m._find_by_name("фильтр масл")] == [1]
+    assert m._find_by_name("насос") == []
+
+
+def test_token_positions_cache_is_bounded(monkeypatch):
+    monkeypatch.setattr("tirika_importer.matcher._TOKEN_POSITIONS_CACHE_SIZE", 2)
+    m = GoodsMatcher({1: good(1, "A", "Фильтры масляные"), 2: good(2, "B", "Свеча зажигания")})
+    assert m._positions_with_token("фильтр") == {0}
+    assert m._positions_with_token("свеч") == {1}
+    assert m._positions_with_token("фильтр") == {0}  # обновляет «свежесть» токена
+    assert m._positions_with_token("масл") == {0}
+    assert list(m._token_positions_cache) == ["фильтр", "масл"]
+
+
+def test_match_lines_reuses_lookup_for_duplicates():
+    m = make_clean()
+    lines = [line(article="W7015"), line(article="W7015", price=200.0), line(name="Свеча Bosch")]
+    single = [line(article="W7015"), line(article="W7015", price=200.0), line(name="Свеча Bosch")]
+    m.match_lines(lines)
+    for ln in single:
+        m.match_line(ln)
+    for got, want in zip(lines, single):
+        assert (got.matched_good_id, got.match_status, got.sell_price, got.candidates) == (
+            want.matched_good_id, want.match_status, want.sell_price, want.candidates,
+        )
+    assert lines[0].candidates is not lines[1].candidates
+
+
 def test_apply_manual_good():
     m = make_clean()
     ln = line(article="NOPE", name="x")
@@ -98,6 +157,15 @@ def test_apply_manual_good():
     assert ln.action == "import"
 
 
+def test_match_line_resets_sell_initialized_flag():
+    m = make_clean()
+    ln = line(article="90915-YZZD4")
+    ln.flags = LINE_FLAG_SELL_INITIALIZED | LINE_FLAG_MANUAL_EDITED
+    m.match_line(ln)
+    # цену продажи нужно пересчитать для нового товара, ручная правка остаётся
+    assert ln.flags == LINE_FLAG_MANUAL_EDITED
+
+
 def test_apply_manual_good_invalid():
     m = make_clean()
     with pytest.raises(ValueError):
@@ -108,6 +176,14 @@ def test_normalize_name():
     assert normalize_name("  Фильтр,  МАСЛЯНЫЙ! ") == "фильтр масляный"
 
 
+def test_normalize_code_alnum():
+    assert normalize_code_alnum(" GM-1104 ") == "gm1104"
+    assert normalize_code_alnum("0986 452_041") == "0986452041"
+    assert normalize_code_alnum("abc123") == "abc123"
+    assert normalize_code_alnum("Фильтр-12Ё") == "фильтр12"  # ё не входит в диапазон а-я
+    assert normalize_code_alnum("  ") == ""
+
+
 def test_build_article_variants_strips_prefix():
     variants = build_article_variants("XMIL-90915")
     assert "90915" in variants
@@ -1,5 +1,14 @@
 """Тесты вспомогательных функций парсера накладных."""
-from tirika_importer.parsers import _find_col, _find_cols, _looks_like_html
+import pytest
+
+from tirika_importer.parsers import (
+    InvoiceParseError,
+    _com_sheet_values,
+    _find_col,
+    _find_cols,
+    _looks_like_html,
+    _parse_mikado_html,
+)
 
 
 def test_find_col():
@@ -35,3 +44,32 @@ def test_looks_like_html(tmp_path):
     p2 = tmp_path / "binary.xls"
     p2.write_bytes(b"PK\x03\x04 binary xlsx zip header, not html")
     assert not _looks_like_html(p2)
+
+
+def test_com_sheet_values_reads_range_in_one_call():
+    class FakeSheet:
+        def __init__(self, value):
+            self.value = value
+            self.calls = 0
+
+        def Cells(self, r, c):
+            return (r, c)
+
+        def Range(self, start, end):
+            self.calls += 1
+            assert start == (1, 1)
+            return type("R", (), {"Value": self.value})()
+
+    sheet = FakeSheet((("Код", "Цена"), ("A1", 10.0)))
+    assert _com_sheet_values(sheet, 2, 2) == [["Код", "Цена"], ["A1", 10.0]]
+    assert sheet.calls == 1
+
+    assert _com_sheet_values(FakeSheet("Код"), 1, 1) == [["Код"]]
+    assert _com_sheet_values(FakeSheet(None), 0, 0) == []
+
+
+def test_mikado_html_without_tables_raises_parse_error(tmp_path):
+    p = tmp_path / "invoice.xls"
+    p.write_bytes("<html><body>Накладная № 1</body></html>".encode("cp1251"))
+    with pytest.raises(InvoiceParseError):
+        _parse_mikado_html(p)
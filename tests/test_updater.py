@@ -1,6 +1,12 @@
 """Тесты апдейтера: сравнение версий, валидация sha256/хоста, разбор manifest."""
 import base64
+import hashlib
 import json
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from pathlib import Path
+from typing import Iterator, Type
 
 import pytest
 
@@ -10,8 +16,13 @@ from tirika_importer.updater import (
     _installer_filename,
     _is_trusted_installer_url,
     _is_valid_sha256,
+    _fetch_manifest,
     _parse_manifest_payload,
+    download_installer,
     is_newer_version,
+    load_cached_update_check,
+    save_update_check,
+    sha256_file,
 )
 
 
@@ -24,6 +35,26 @@ def test_version_compare():
     assert is_newer_version("2.0", "1.99.99")
 
 
+def test_sha256_file(tmp_path):
+    payload = b"installer" * 300_000
+    path = tmp_path / "setup.exe"
+    path.write_bytes(payload)
+    assert sha256_file(path) == hashlib.sha256(payload).hexdigest()
+
+
+def test_sha256_file_without_file_digest(tmp_path, monkeypatch):
+    monkeypatch.delattr(hashlib, "file_digest", raising=False)
+    payload = b"installer" * 300_000
+    path = tmp_path / "setup.exe"
+    path.write_bytes(payload)
+    assert sha256_file(path) == hashlib.sha256(payload).hexdigest()
+    monkeypatch.setattr("tirika_importer.updater._MMAP_HASH_LIMIT", 1024)
+    assert sha256_file(path) == hashlib.sha256(payload).hexdigest()
+    empty = tmp_path / "empty.exe"
+    empty.write_bytes(b"")
+    assert sha256_file(empty) == hashlib.sha256(b"").hexdigest()
+
+
 def test_valid_sha256():
     assert _is_valid_sha256("a" * 64)
     assert not _is_valid_sha256("a" * 63)
@@ -66,3 +97,177 @@ def test_installer_filename():
     assert _installer_filename(info) == "Dazzle-Setup.exe"
     info2 = UpdateInfo(version="1.2.3", installer_url="https://github.com/o/r/releases/download/v1/")
     assert _installer_filename(info2) == "Dazzle-Setup-1.2.3.exe"
+
+
+def test_download_installer_verifies_sha256_while_streaming(tmp_path):
+    payload = b"installer" * 300_000  # больше одного блока чтения
+    source = tmp_path / "Dazzle-Setup.exe"
+    source.write_bytes(payload)
+    good = UpdateInfo(
+        version="1.2.3",
+        installer_url=source.as_uri(),
+        sha256=hashlib.sha256(payload).hexdigest(),
+    )
+    seen: list[tuple[int, int]] = []
+
+    path = download_installer(good, tmp_path / "out", progress_cb=lambda d, t: seen.append((d, t)))
+
+    assert path.read_bytes() == payload
+    assert seen[-1] == (len(payload), len(payload))
+
+    bad = UpdateInfo(version="1.2.3", installer_url=source.as_uri(), sha256="0" * 64)
+    with pytest.raises(UpdateError):
+        download_installer(bad, tmp_path / "bad")
+    assert not any((tmp_path / "bad").iterdir())
+
+    unsigned = UpdateInfo(version="1.2.3", installer_url=source.as_uri(), sha256="")
+    with pytest.raises(UpdateError):
+        download_installer(unsigned, tmp_path / "unsigned")
+    assert not (tmp_path / "unsigned").exists()  # отклонено до скачивания
+
+    # Уже скачанный установщик с тем же sha256 не качается повторно.
+    source.unlink()
+    assert download_installer(good, tmp_path / "out") == path
+
+
+def test_update_check_cache_roundtrip_and_expiry(tmp_path):
+    cache = tmp_path / "update_check.json"
+    url = "https://example.com/latest.json"
+    info = UpdateInfo(
+        version="2.0.0",
+        installer_url="https://github.com/o/r/releases/download/v2/Dazzle-Setup.exe",
+        sha256="a" * 64,
+    )
+    assert load_cached_update_check(cache, url, "1.0.0") == (False, None)
+
+    save_update_check(cache, url, "1.0.0", info, now=1000.0)
+    assert load_cached_update_check(cache, url, "1.0.0", now=1500.0) == (True, info)
+    # Протух, другой manifest или уже обновились — идём в сеть заново.
+    assert load_cached_update_check(cache, url, "1.0.0", ttl_sec=100, now=1500.0) == (False, None)
+    assert load_cached_update_check(cache, url + "?x", "1.0.0", now=1500.0) == (False, None)
+    assert load_cached_update_check(cache, url, "2.0.0", now=1500.0) == (False, None)
+
+    save_update_check(cache, url, "1.0.0", None, now=1000.0)
+    assert load_cached_update_check(cache, url, "1.0.0", now=1500.0) == (True, None)
+
+
+@contextmanager
+def _serve(handler_cls: Type[BaseHTTPRequestHandler]) -> Iterator[str]:
+    """Локальный HTTP-сервер на время теста; отдаёт базовый URL."""
+    server = HTTPServer(("127.0.0.1", 0), handler_cls)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_port}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+class _QuietHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def test_fetch_manifest_uses_etag_and_304(monkeypatch):
+    body = json.dumps({"version": "1.0", "url": "x", "sha256": "a" * 64}).encode()
+    seen_etags: list[str | None] = []
+
+    class Handler(_QuietHandler):
+        def do_GET(self):
+            seen_etags.append(self.headers.get("If-None-Match"))
+            if self.headers.get("If-None-Match") == '"v1"':
+                self.send_response(304)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("ETag", '"v1"')
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    monkeypatch.setattr("tirika_importer.updater._MANIFEST_CACHE", {})
+    with _serve(Handler) as base_url:
+        url = f"{base_url}/latest.json"
+        first = _fetch_manifest(url, timeout_sec=5)
+        second = _fetch_manifest(url, timeout_sec=5)
+    assert first == second == json.loads(body)
+    assert seen_etags == [None, '"v1"']
+
+
+def test_download_installer_resumes_partial_file(tmp_path, monkeypatch):
+    payload = b"installer" * 300_000
+    ranges: list[str | None] = []
+
+    class Handler(_QuietHandler):
+        def do_GET(self):
+            ranges.append(self.headers.get("Range"))
+            start = int(self.headers["Range"][6:-1]) if self.headers.get("Range") else 0
+            self.send_response(206 if start else 200)
+            self.send_header("Content-Length", str(len(payload) - start))
+            self.end_headers()
+            self.wfile.write(payload[start:])
+
+    out_dir = tmp_path / "out"
+    out_dir.mkdir()
+    part = out_dir / "Dazzle-Setup.exe.part"
+    with _serve(Handler) as base_url:
+        info = UpdateInfo(
+            version="1.2.3",
+            installer_url=f"{base_url}/Dazzle-Setup.exe",
+            sha256=hashlib.sha256(payload).hexdigest(),
+        )
+        part.write_bytes(payload[:1000])
+        path = download_installer(info, out_dir)
+        assert path.read_bytes() == payload
+        assert ranges == ["bytes=1000-"]
+
+        # Устаревший .part с чужими байтами: после несовпадения sha256 — заново целиком.
+        path.unlink()
+        part.write_bytes(b"x" * 1000)
+        path = download_installer(info, out_dir)
+        assert path.read_bytes() == payload
+        assert ranges[1:] == ["bytes=1000-", None]
+
+        # .part не читается (антивирус, нет прав) — не ошибка: качаем заново целиком.
+        path.unlink()
+        part.write_bytes(payload[:1000])
+        real_open = Path.open
+
+        def locked_open(self, mode="r", *args, **kwargs):
+            if self == part and mode == "rb":
+                raise PermissionError("locked")
+            return real_open(self, mode, *args, **kwargs)
+
+        monkeypatch.setattr(Path, "open", locked_open)
+        path = download_installer(info, out_dir)
+        assert path.read_bytes() == payload
+        assert ranges[3:] == [None]
+
+
+def test_download_installer_trims_preallocated_tail_after_broken_connection(tmp_path, monkeypatch):
+    monkeypatch.setattr("tirika_importer.updater.time.sleep", lambda _sec: None)
+    payload = b"installer" * 300_000
+    half = len(payload) // 2
+    ranges: list[str | None] = []
+
+    class Handler(_QuietHandler):
+        def do_GET(self):
+            ranges.append(self.headers.get("Range"))
+            start = int(self.headers["Range"][6:-1]) if self.headers.get("Range") else 0
+            self.send_response(206 if start else 200)
+            self.send_header("Content-Length", str(len(payload) - start))
+            self.end_headers()
+            # Первый ответ обрывается на середине при заявленном полном размере.
+            self.wfile.write(payload[start:] if start else payload[:half])
+            self.close_connection = True
+
+    with _serve(Handler) as base_url:
+        info = UpdateInfo(
+            version="1.2.3",
+            installer_url=f"{base_url}/Dazzle-Setup.exe",
+            sha256=hashlib.sha256(payload).hexdigest(),
+        )
+        path = download_installer(info, tmp_path / "out")
+    assert path.read_bytes() == payload
+    assert ranges == [None, f"bytes={half}-"]
@@ -203,7 +203,11 @@ def save_app_settings(settings: AppSettings) -> Path:
     path = settings_file_path()
     path.parent.mkdir(parents=True, exist_ok=True)
     payload = asdict(settings)
-    path.write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8")
+    # Сначала пишем во временный файл и только потом подменяем settings.json:
+    # при сбое посреди записи старые настройки остаются целыми.
+    tmp_path = path.with_name(path.name + ".tmp")
+    tmp_path.write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8")
+    os.replace(tmp_path, path)
     return path
 
 
@@ -34,21 +34,57 @@ DB_ONLY_COLUMNS = (
 )
 
 # Колонки с числами/кодами — моноширинный шрифт для выравнивания по разрядам.
-MONO_COLUMNS = (
-    COL_LINE,
-    COL_ARTICLE,
-    COL_QTY,
-    COL_BUY_PRICE,
-    COL_SUM,
-    COL_SELL_PRICE,
-    COL_SELL_PRICE_OLD,
-    COL_SELL_DIFF,
-    COL_MARKUP,
-    COL_GOOD_ID,
-    COL_GOOD_CODE,
+MONO_COLUMNS = frozenset(
+    {
+        COL_LINE,
+        COL_ARTICLE,
+        COL_QTY,
+        COL_BUY_PRICE,
+        COL_SUM,
+        COL_SELL_PRICE,
+        COL_SELL_PRICE_OLD,
+        COL_SELL_DIFF,
+        COL_MARKUP,
+        COL_GOOD_ID,
+        COL_GOOD_CODE,
+    }
+)
+
+# Числовые колонки выравниваются по правому краю.
+RIGHT_ALIGNED_COLUMNS = frozenset(
+    {
+        COL_LINE,
+        COL_QTY,
+        COL_BUY_PRICE,
+        COL_SELL_PRICE,
+        COL_SELL_PRICE_OLD,
+        COL_SELL_DIFF,
+        COL_MARKUP,
+        COL_SUM,
+        COL_GOOD_ID,
+    }
 )
 
+# Колонки, которые пользователь не редактирует в таблице накладной.
+READ_ONLY_COLUMNS = frozenset(
+    {
+        COL_LINE,
+        COL_STATUS,
+        COL_METHOD,
+        COL_SELL_DIFF,
+        COL_MARKUP,
+        COL_SIMILAR,
+        COL_WARNING,
+    }
+)
+
+# Колонки с тёмным текстом (поверх подсветки статуса).
+DARK_TEXT_COLUMNS = frozenset({COL_STATUS, COL_WARNING, COL_GOOD_CODE, COL_GOOD_NAME, COL_METHOD})
+
+LINE_ACTIONS = ("import", "create", "skip")
+
 MAX_HISTORY_STATES = 80
+MAX_CACHED_CATALOGS = 4
 ROLE_SELL_DB_OLD_PRICE = Qt.UserRole + 101
 
 OZ_COL_LINE = 0
@@ -96,7 +132,12 @@ __all__ = [
     "COL_WARNING",
     "DB_ONLY_COLUMNS",
     "MONO_COLUMNS",
+    "RIGHT_ALIGNED_COLUMNS",
+    "READ_ONLY_COLUMNS",
+    "DARK_TEXT_COLUMNS",
+    "LINE_ACTIONS",
     "MAX_HISTORY_STATES",
+    "MAX_CACHED_CATALOGS",
     "ROLE_SELL_DB_OLD_PRICE",
     "OZ_COL_LINE",
     "OZ_COL_ORDER",
@@ -10,6 +10,7 @@ from datetime import datetime
 from pathlib import Path
 
 from .models import (
+    LINE_FLAG_FORCE_UPDATE_SELL_PRICE,
     ImportOptions,
     ImportResult,
     InvoiceLine,
@@ -75,28 +76,47 @@ class TirikaDB:
         shutil.copy2(self.db_path, backup_path)
         return backup_path
 
+    def list_reference_data(
+        self,
+    ) -> tuple[list[tuple[int, str]], list[tuple[int, str]], list[tuple[int, str]]]:
+        """Поставщики, пользователи и склады за одно подключение к базе."""
+        with self._connect() as conn:
+            return (
+                self._query_suppliers(conn),
+                self._query_users(conn),
+                self._query_shops(conn),
+            )
+
     def list_suppliers(self) -> list[tuple[int, str]]:
         with self._connect() as conn:
-            rows = conn.execute(
-                """
-                SELECT id, name
-                FROM suppliers
-                WHERE is_deleted = 0
-                ORDER BY name, id
-                """
-            ).fetchall()
-        return [(int(row[0]), decode_db_text(row[1])) for row in rows]
+            return self._query_suppliers(conn)
 
     def list_users(self) -> list[tuple[int, str]]:
         with self._connect() as conn:
-            rows = conn.execute(
-                """
-                SELECT id, name
-                FROM users
-                WHERE is_deleted = 0
-                ORDER BY id
-                """
-            ).fetchall()
+            return self._query_users(conn)
+
+    @staticmethod
+    def _query_suppliers(conn: sqlite3.Connection) -> list[tuple[int, str]]:
+        rows = conn.execute(
+            """
+            SELECT id, name
+            FROM suppliers
+            WHERE is_deleted = 0
+            ORDER BY name, id
+            """
+        ).fetchall()
+        return [(int(row[0]), decode_db_text(row[1])) for row in rows]
+
+    @staticmethod
+    def _query_users(conn: sqlite3.Connection) -> list[tuple[int, str]]:
+        rows = conn.execute(
+            """
+            SELECT id, name
+            FROM users
+            WHERE is_deleted = 0
+            ORDER BY id
+            """
+        ).fetchall()
         return [(int(row[0]), decode_db_text(row[1])) for row in rows]
 
     def list_customers(self) -> list[tuple[int, str]]:
@@ -119,16 +139,20 @@ class TirikaDB:
         return out
 
     def list_shops(self) -> list[tuple[int, str]]:
-        shops: list[tuple[int, str]] = []
         with self._connect() as conn:
-            rows = conn.execute(
-                """
-                SELECT settings_name, settings_value
-                FROM settings
-                WHERE settings_name LIKE 'SHOP %'
-                ORDER BY settings_name
-                """
-            ).fetchall()
+            return self._query_shops(conn)
+
+    @staticmethod
+    def _query_shops(conn: sqlite3.Connection) -> list[tuple[int, str]]:
+        shops: list[tuple[int, str]] = []
+        rows = conn.execute(
+            """
+            SELECT settings_name, settings_value
+            FROM settings
+            WHERE settings_name LIKE 'SHOP %'
+            ORDER BY settings_name
+            """
+        ).fetchall()
         for row in rows:
             key = decode_db_text(row[0]).strip()
             value = decode_db_text(row[1]).strip()
@@ -648,7 +672,7 @@ class TirikaDB:
                     else calculate_suggested_sell_price(line.price),
                     2,
                 )
-                force_sell_update = bool(line.raw_data.get("_force_update_sell_price", False))
+                force_sell_update = bool(line.flags & LINE_FLAG_FORCE_UPDATE_SELL_PRICE)
                 set_values: dict[str, object] = {}
 
                 if options.update_existing_buy_price:
@@ -1,12 +1,19 @@
 from __future__ import annotations
 
-import copy
+import base64
+import binascii
+from collections import Counter, OrderedDict, deque
+from dataclasses import dataclass, field, fields, replace
 from datetime import datetime
+from functools import lru_cache
 import os
 from pathlib import Path
+import pickle
 import re
 import sys
+import time
 import traceback
+import zlib
 
 from .app_settings import AppSettings, load_app_settings, save_app_settings
 from .config import load_config
@@ -18,8 +25,13 @@ from .db import (
     normalize_article,
     normalize_text_field,
 )
+from .invoice_arrays import InvoiceArrays, sell_price_diff_percents, suggested_sell_prices
 from .matcher import GoodsMatcher
 from .models import (
+    LINE_FLAG_FORCE_UPDATE_SELL_PRICE,
+    LINE_FLAG_MANUAL_EDITED,
+    LINE_FLAG_PRICE_APPLIED,
+    LINE_FLAG_SELL_INITIALIZED,
     ImportOptions,
     ImportResult,
     InvoiceLine,
@@ -70,6 +82,7 @@ from .qt_compat import (
     QProgressDialog,
     QPushButton,
     QScrollArea,
+    QSignalBlocker,
     QSplitter,
     QStyle,
     QStyledItemDelegate,
@@ -101,7 +114,16 @@ from .workers import (
     UpdateDownloadWorker,
 )
 from .startup import StartupError, disable_startup, enable_startup, is_enabled, is_supported
-from .updater import UpdateError, UpdateInfo, check_for_update, download_installer, run_installer
+from .updater import (
+    UPDATE_CHECK_CACHE_NAME,
+    UpdateError,
+    UpdateInfo,
+    check_for_update,
+    download_installer,
+    load_cached_update_check,
+    run_installer,
+    save_update_check,
+)
 from .version import APP_NAME, APP_VERSION, display_app_title
 
 
@@ -127,7 +149,12 @@ from .constants import (
     COL_WARNING,
     DB_ONLY_COLUMNS,
     MONO_COLUMNS,
+    RIGHT_ALIGNED_COLUMNS,
+    READ_ONLY_COLUMNS,
+    DARK_TEXT_COLUMNS,
+    LINE_ACTIONS,
     MAX_HISTORY_STATES,
+    MAX_CACHED_CATALOGS,
     ROLE_SELL_DB_OLD_PRICE,
     OZ_COL_LINE,
     OZ_COL_ORDER,
@@ -255,6 +282,93 @@ class SellDbPriceDelegate(QStyledItemDelegate):
         painter.restore()
 
 
+class ActionDelegate(QStyledItemDelegate):
+    # Колонка «Действие»: вместо QComboBox в каждой строке делегат рисует
+    # плашку с действием, а комбобокс создаёт только на время редактирования.
+    _COLORS = {
+        "import": (QColor("#E7F6EE"), QColor("#15803D"), QColor("#BFE6CD")),
+        "create": (QColor("#E9EFFC"), QColor("#1E40AF"), QColor("#C6D6F5")),
+        "skip": (QColor("#F1F4F9"), QColor("#64748B"), QColor("#D6DEEA")),
+    }
+
+    def __init__(self, parent: QWidget | None = None, actions: tuple[str, ...] = LINE_ACTIONS) -> None:
+        super().__init__(parent)
+        self._actions = tuple(actions)
+
+    def paint(self, painter: QPainter, option: QStyleOptionViewItem, index) -> None:
+        opt = QStyleOptionViewItem(option)
+        self.initStyleOption(opt, index)
+        action = opt.text if opt.text in self._COLORS else "skip"
+        opt.text = ""
+        style = opt.widget.style() if opt.widget is not None else QApplication.style()
+        style.drawControl(QStyle.CE_ItemViewItem, opt, painter, opt.widget)
+
+        background, foreground, border = self._COLORS[action]
+        rect = opt.rect.adjusted(3, 2, -3, -2)
+        font = opt.font
+        font.setBold(True)
+
+        painter.save()
+        painter.setRenderHint(QPainter.Antialiasing, True)
+        painter.setPen(QPen(border))
+        painter.setBrush(background)
+        painter.drawRoundedRect(rect, 6, 6)
+        painter.setFont(font)
+        painter.setPen(foreground)
+        painter.drawText(rect.adjusted(6, 0, -18, 0), Qt.AlignLeft | Qt.AlignVCenter, action)
+        arrow_x = rect.right() - 10
+        arrow_y = rect.center().y()
+        painter.drawLine(arrow_x - 3, arrow_y - 1, arrow_x, arrow_y + 2)
+        painter.drawLine(arrow_x, arrow_y + 2, arrow_x + 3, arrow_y - 1)
+        painter.restore()
+
+    def editorEvent(self, event, model, option: QStyleOptionViewItem, index) -> bool:
+        # Как и у прежнего комбобокса: список действий открывается одним кликом.
+        if (
+            event.type() == QEvent.MouseButtonRelease
+            and event.button() == Qt.LeftButton
+            and event.modifiers() == Qt.NoModifier
+            and isinstance(option.widget, QAbstractItemView)
+            and index.flags() & Qt.ItemIsEditable
+        ):
+            option.widget.edit(index)
+            return True
+        return super().editorEvent(event, model, option, index)
+
+    def createEditor(self, parent: QWidget, option: QStyleOptionViewItem, index) -> QWidget:
+        combo = QComboBox(parent)
+        combo.addItems(list(self._actions))
+        combo.activated.connect(lambda _idx, editor=combo: self._commit_and_close(editor))
+
+        def show_popup() -> None:
+            try:
+                if combo.isVisible():
+                    combo.showPopup()
+            except RuntimeError:
+                pass
+
+        QTimer.singleShot(0, show_popup)
+        return combo
+
+    def setEditorData(self, editor: QWidget, index) -> None:
+        if not isinstance(editor, QComboBox):
+            super().setEditorData(editor, index)
+            return
+        action = str(index.data(Qt.EditRole) or "")
+        editor.setCurrentText(action if action in self._actions else "skip")
+        editor.setProperty("actionKind", editor.currentText())
+
+    def setModelData(self, editor: QWidget, model, index) -> None:
+        if not isinstance(editor, QComboBox):
+            super().setModelData(editor, model, index)
+            return
+        model.setData(index, editor.currentText(), Qt.EditRole)
+
+    def _commit_and_close(self, editor: QComboBox) -> None:
+        self.commitData.emit(editor)
+        self.closeEditor.emit(editor)
+
+
 class GoodsPickerDialog(QDialog):
     def __init__(
         self,
@@ -639,7 +753,7 @@ class ImportResultDialog(QDialog):
     ) -> tuple[str, str]:
         raw = (warning or "").strip()
         line_no = self._extract_warning_line_no(raw)
-        reason = re.sub(r"^\s*строка\s+\d+\s*:\s*", "", raw, flags=re.IGNORECASE).strip() or raw
+        reason = _WARNING_LINE_PREFIX_RE.sub("", raw).strip() or raw
 
         line = line_by_no.get(line_no or -1)
         article = line.article.strip() if line else ""
@@ -667,7 +781,7 @@ class ImportResultDialog(QDialog):
         return "ВНИМАНИЕ"
 
     def _extract_warning_line_no(self, warning: str) -> int | None:
-        m = re.search(r"строка\s+(\d+)", warning, flags=re.IGNORECASE)
+        m = _WARNING_LINE_NO_RE.search(warning)
         if not m:
             return None
         try:
@@ -825,21 +939,21 @@ class OzonDialog(QDialog):
         settings_row.addWidget(QLabel("Из:"))
         self.source_shop_combo = QComboBox(self)
         for sid, name in self.shops:
-            self.source_shop_combo.addItem(f"{name} [{sid}]", userData=int(sid))
+            _combo_add_item(self.source_shop_combo, sid, name)
         self._set_combo_by_data(self.source_shop_combo, self._default_shop_id("авто", 0))
         settings_row.addWidget(self.source_shop_combo)
 
         settings_row.addWidget(QLabel("В:"))
         self.target_shop_combo = QComboBox(self)
         for sid, name in self.shops:
-            self.target_shop_combo.addItem(f"{name} [{sid}]", userData=int(sid))
+            _combo_add_item(self.target_shop_combo, sid, name)
         self._set_combo_by_data(self.target_shop_combo, self._default_shop_id("озон", 1))
         settings_row.addWidget(self.target_shop_combo)
 
         settings_row.addWidget(QLabel("Пользователь:"))
         self.user_combo = QComboBox(self)
         for uid, name in self.users:
-            self.user_combo.addItem(f"{name} [{uid}]", userData=int(uid))
+            _combo_add_item(self.user_combo, uid, name)
         self._set_combo_by_data(self.user_combo, self.app_settings.user_id)
         settings_row.addWidget(self.user_combo)
 
@@ -914,7 +1028,9 @@ class OzonDialog(QDialog):
         self.table.horizontalHeader().setStretchLastSection(True)
         self.table.setContextMenuPolicy(Qt.CustomContextMenu)
         self.table.customContextMenuRequested.connect(self._on_context_menu)
-        self.table.itemDoubleClicked.connect(lambda _: self._pick_good_for_selected())
+        self.table.itemDoubleClicked.connect(self._on_item_double_clicked)
+        self._action_delegate = ActionDelegate(self.table, actions=("import", "skip"))
+        self.table.setItemDelegateForColumn(OZ_COL_ACTION, self._action_delegate)
         root.addWidget(self.table, 1)
 
         footer = QFrame(self)
@@ -978,7 +1094,7 @@ class OzonDialog(QDialog):
         self._update_buttons()
 
     def _browse_file(self) -> None:
-        start_dir = self.app_settings.invoices_dir.strip() or str(Path.home() / "Downloads")
+        start_dir = self.app_settings.invoices_dir.strip() or _downloads_dir_str()
         file_path, _ = QFileDialog.getOpenFileName(
             self,
             "Выберите CSV Ozon",
@@ -1101,6 +1217,9 @@ class OzonDialog(QDialog):
         if self.parsed is None:
             return
         self._table_locked = True
+        table_updates_enabled = self.table.updatesEnabled()
+        table_signals_blocked = self.table.blockSignals(True)
+        self.table.setUpdatesEnabled(False)
         try:
             self.table.setRowCount(len(self.parsed.lines))
             self._line_by_row = list(self.parsed.lines)
@@ -1117,31 +1236,24 @@ class OzonDialog(QDialog):
                     _fmt_number(float(line.sale_total or 0.0), 2),
                     "" if line.remainder_source is None else _fmt_number(float(line.remainder_source), 3),
                     self._status_text(line),
-                    "",
+                    line.action if line.action in {"import", "skip"} else "skip",
                     line.warning,
                 ]
                 for col, value in enumerate(values):
-                    if col == OZ_COL_ACTION:
-                        continue
                     item = QTableWidgetItem(value)
                     if col in {OZ_COL_LINE, OZ_COL_QTY, OZ_COL_PRICE, OZ_COL_SUM, OZ_COL_REMAINDER}:
                         item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
                     else:
                         item.setTextAlignment(Qt.AlignLeft | Qt.AlignVCenter)
-                    if col not in {OZ_COL_QTY, OZ_COL_PRICE}:
+                    if col not in {OZ_COL_QTY, OZ_COL_PRICE, OZ_COL_ACTION}:
                         item.setFlags(item.flags() & ~Qt.ItemIsEditable)
                     self._paint_item(item, line)
                     self.table.setItem(row, col, item)
-
-                combo = QComboBox(self.table)
-                combo.addItem("import")
-                combo.addItem("skip")
-                combo.setCurrentText(line.action if line.action in {"import", "skip"} else "skip")
-                combo.setProperty("actionKind", combo.currentText())
-                combo.currentTextChanged.connect(lambda text, r=row: self._on_action_changed(r, text))
-                self.table.setCellWidget(row, OZ_COL_ACTION, combo)
             self.table.resizeColumnsToContents()
         finally:
+            self.table.blockSignals(table_signals_blocked)
+            self.table.setUpdatesEnabled(table_updates_enabled)
+            self.table.viewport().update()
             self._table_locked = False
         self._update_summary()
 
@@ -1172,13 +1284,25 @@ class OzonDialog(QDialog):
             return
         line = self._line_by_row[row]
         line.action = text if text in {"import", "skip"} else "skip"
-        widget = self.table.cellWidget(row, OZ_COL_ACTION)
-        if widget is not None:
-            widget.setProperty("actionKind", line.action)
-            widget.style().unpolish(widget)
-            widget.style().polish(widget)
+        if line.action != text:
+            self._set_action_cells({row: line.action})
         self._update_summary()
 
+    def _set_action_cells(self, actions: dict[int, str]) -> None:
+        self._table_locked = True
+        try:
+            for row, action in actions.items():
+                item = self.table.item(row, OZ_COL_ACTION)
+                if item is not None:
+                    item.setText(action)
+        finally:
+            self._table_locked = False
+
+    def _on_item_double_clicked(self, item: QTableWidgetItem) -> None:
+        # Колонку «Действие» редактирует делегат, двойной клик по ней не открывает подбор товара.
+        if item.column() != OZ_COL_ACTION:
+            self._pick_good_for_selected()
+
     def _on_table_item_changed(self, item: QTableWidgetItem) -> None:
         if self._table_locked:
             return
@@ -1187,7 +1311,9 @@ class OzonDialog(QDialog):
         if row < 0 or row >= len(self._line_by_row):
             return
         line = self._line_by_row[row]
-        if col == OZ_COL_QTY:
+        if col == OZ_COL_ACTION:
+            self._on_action_changed(row, item.text())
+        elif col == OZ_COL_QTY:
             try:
                 line.quantity = max(0.0, float(item.text().replace(",", ".")))
                 recalculate_ozon_prices(self._line_by_row)
@@ -1224,12 +1350,12 @@ class OzonDialog(QDialog):
 
     def _set_selected_actions(self, action: str) -> None:
         rows = sorted({idx.row() for idx in self.table.selectedIndexes()})
+        changed: dict[int, str] = {}
         for row in rows:
             if 0 <= row < len(self._line_by_row):
                 self._line_by_row[row].action = action
-                combo = self.table.cellWidget(row, OZ_COL_ACTION)
-                if isinstance(combo, QComboBox):
-                    combo.setCurrentText(action)
+                changed[row] = action
+        self._set_action_cells(changed)
         self._update_summary()
 
     def _pick_good_for_selected(self) -> None:
@@ -1428,10 +1554,7 @@ class OzonDialog(QDialog):
 
     @staticmethod
     def _set_combo_by_data(combo: QComboBox, target: int) -> None:
-        for idx in range(combo.count()):
-            if int(combo.itemData(idx) or -999999) == int(target):
-                combo.setCurrentIndex(idx)
-                return
+        _set_combo_by_id(combo, target)
 
 
 class OzonPanel(OzonDialog):
@@ -1659,14 +1782,14 @@ class SettingsDialog(QDialog):
         import_layout.addWidget(QLabel("Пользователь:"), 0, 0)
         self.user_combo = QComboBox(self)
         for user_id, name in users:
-            self.user_combo.addItem(f"{name} [{user_id}]", userData=user_id)
+            _combo_add_item(self.user_combo, user_id, name)
         self.user_combo.setToolTip("Пользователь, от имени которого создается закупка.")
         import_layout.addWidget(self.user_combo, 0, 1)
 
         import_layout.addWidget(QLabel("Склад:"), 0, 2)
         self.shop_combo = QComboBox(self)
         for shop_id, name in shops:
-            self.shop_combo.addItem(f"{name} [{shop_id}]", userData=shop_id)
+            _combo_add_item(self.shop_combo, shop_id, name)
         self.shop_combo.setToolTip("Склад, на который будет приход товара.")
         import_layout.addWidget(self.shop_combo, 0, 3)
 
@@ -1923,7 +2046,7 @@ class SettingsDialog(QDialog):
         path, _ = QFileDialog.getOpenFileName(
             self,
             "Выберите файл базы Tirika",
-            str(Path.cwd()),
+            _cwd_str(),
             "SQLite DB (*.db);;Все файлы (*.*)",
         )
         if path:
@@ -1933,7 +2056,7 @@ class SettingsDialog(QDialog):
         path = QFileDialog.getExistingDirectory(
             self,
             "Выберите папку с накладными",
-            self.invoices_dir_edit.text().strip() or str(Path.cwd()),
+            self.invoices_dir_edit.text().strip() or _cwd_str(),
         )
         if path:
             self.invoices_dir_edit.setText(path)
@@ -1979,11 +2102,7 @@ class SettingsDialog(QDialog):
 
     @staticmethod
     def _set_combo_by_data(combo: QComboBox, target: int) -> None:
-        for idx in range(combo.count()):
-            data = combo.itemData(idx)
-            if data is not None and int(data) == int(target):
-                combo.setCurrentIndex(idx)
-                return
+        _set_combo_by_id(combo, target)
 
     @staticmethod
     def _set_combo_by_text_data(combo: QComboBox, target: str) -> None:
@@ -2003,7 +2122,32 @@ class SettingsDialog(QDialog):
         return text or default
 
 
+@dataclass
+class _HistoryEntry:
+    # Переход между соседними состояниями истории. Удалённые/добавленные
+    # строки хранятся целиком (start, before/after — pickle списков строк),
+    # правки без изменения числа строк — только изменившиеся поля:
+    # {строка: (pickle старых значений, pickle новых значений)}.
+    start: int = 0
+    before_count: int = 0
+    before: bytes = b""
+    after_count: int = 0
+    after: bytes = b""
+    patch: dict[int, tuple[bytes, bytes]] = field(default_factory=dict)
+
+
 class MainWindow(QMainWindow):
+    # Цвета подсветки таблицы накладной создаются один раз, а не на каждую ячейку.
+    _TEXT_DARK = QColor(20, 20, 20)
+    _PRICE_ALERT_BG = QColor(255, 184, 184)
+    _PRICE_ALERT_FG = QColor(92, 0, 0)
+    _PRICE_APPLIED_BG = QColor(221, 236, 255)
+    _CANCELLED_NOTE_FG = QColor(190, 18, 18)
+    _MANUAL_EDIT_BG = QColor(232, 243, 255)
+    _ALIGN_RIGHT = Qt.AlignRight | Qt.AlignVCenter
+    _READ_ONLY_MASK = ~Qt.ItemIsEditable
+    _LOG_MAX_BLOCKS = 400
+
     def __init__(self) -> None:
         super().__init__()
         self.setWindowTitle(display_app_title())
@@ -2018,17 +2162,41 @@ class MainWindow(QMainWindow):
         self.shops: list[tuple[int, str]] = []
         self._table_locked = False
         self.debug_log_enabled = False
-        self._restoring_header_state = False
+        # Метка времени журнала пересчитывается не чаще раза в секунду.
+        self._log_stamp_sec = -1
+        self._log_stamp = ""
+        # Пока журнал скрыт, сообщения (с исключением для traceback) копятся здесь
+        # и выводятся одним вызовом при открытии.
+        self._pending_log_lines: deque[tuple[str, BaseException | None]] = deque(
+            maxlen=self._LOG_MAX_BLOCKS
+        )
         self._column_layout_initialized = False
-        self._history: list[list[InvoiceLine]] = []
+        # В истории хранятся переходы между состояниями: N состояний — это N - 1 переход.
+        self._history: deque[_HistoryEntry] = deque(maxlen=MAX_HISTORY_STATES - 1)
+        self._history_lines: list[InvoiceLine] = []
+        self._invoice_arrays: InvoiceArrays | None = None
         self._history_index = -1
-        self._history_restoring = False
+        # Правки ячеек подряд записываются в историю одним снимком после паузы;
+        # перед отменой/повтором отложенная запись выполняется сразу.
+        self._history_record_timer = QTimer(self)
+        self._history_record_timer.setSingleShot(True)
+        self._history_record_timer.setInterval(150)
+        self._history_record_timer.timeout.connect(self._record_history_state)
         self._column_state_save_timer = QTimer(self)
         self._column_state_save_timer.setSingleShot(True)
         self._column_state_save_timer.setInterval(350)
         self._column_state_save_timer.timeout.connect(
             lambda: self._save_table_header_state(silent=True)
         )
+        # Последнее сохранённое состояние заголовка: (сырые байты, base64 в настройках).
+        self._header_state_cache: tuple[bytes, str] | None = None
+        # Частые изменения настроек (ширина колонок, магазин, оплата) пишутся
+        # на диск одной записью после паузы, а не на каждое событие.
+        self._settings_dirty = False
+        self._settings_flush_timer = QTimer(self)
+        self._settings_flush_timer.setSingleShot(True)
+        self._settings_flush_timer.setInterval(500)
+        self._settings_flush_timer.timeout.connect(self._flush_settings)
         self._update_download_thread: QThread | None = None
         self._update_download_worker: UpdateDownloadWorker | None = None
         self._update_progress_dialog: QProgressDialog | None = None
@@ -2037,10 +2205,23 @@ class MainWindow(QMainWindow):
         self._db_open_worker: DbOpenWorker | None = None
         self._catalog_load_thread: QThread | None = None
         self._catalog_load_worker: CatalogLoadWorker | None = None
+        self._catalog_load_key: tuple[str, tuple[int, int], int] | None = None
+        self._db_open_stamp: tuple[int, int] | None = None
+        self._loaded_catalog_shop_id: int | None = None
+        # Недавно загруженные каталоги по (путь к БД, отметка изменения файлов, магазин):
+        # переключение между магазинами туда-обратно не перечитывает базу.
+        self._catalog_cache: OrderedDict[tuple[str, tuple[int, int], int], dict[int, GoodRecord]] = (
+            OrderedDict()
+        )
         self._invoice_load_thread: QThread | None = None
         self._invoice_load_worker: InvoiceLoadWorker | None = None
         self._match_thread: QThread | None = None
         self._match_worker: MatchWorker | None = None
+        self._match_snapshots: list[tuple] | None = None
+        self._supplier_hint_names: list[tuple[str, frozenset[str], int]] = []
+        self._supplier_exact_index: dict[str, int] = {}
+        self._populated_settings_key: tuple | None = None
+        self._cell_prototype_items: list[QTableWidgetItem] | None = None
         self._import_thread: QThread | None = None
         self._import_worker: ImportWorker | None = None
         self._ui_busy_counter = 0
@@ -2061,6 +2242,10 @@ class MainWindow(QMainWindow):
             )
             event.ignore()
             return
+        if self._column_state_save_timer.isActive():
+            self._column_state_save_timer.stop()
+            self._save_table_header_state(silent=True)
+        self._flush_settings()
         super().closeEvent(event)
 
     def _has_running_worker(self) -> bool:
@@ -2297,11 +2482,16 @@ class MainWindow(QMainWindow):
         self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Interactive)
         self.table.horizontalHeader().setSectionsMovable(True)
         self.table.verticalHeader().setDefaultSectionSize(28)
+        # Высота строк одинаковая: Qt не опрашивает sizeHint каждой строки.
+        self.table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
         self.table.horizontalHeader().setStretchLastSection(True)
+        self.table.setShowGrid(False)
         self.table.setContextMenuPolicy(Qt.CustomContextMenu)
         self.table.customContextMenuRequested.connect(self._on_table_context_menu)
         self._sell_db_delegate = SellDbPriceDelegate(self.table)
         self.table.setItemDelegateForColumn(COL_SELL_PRICE_OLD, self._sell_db_delegate)
+        self._action_delegate = ActionDelegate(self.table)
+        self.table.setItemDelegateForColumn(COL_ACTION, self._action_delegate)
         self.table.installEventFilter(self)
         self.table.viewport().installEventFilter(self)
         self.table.setWordWrap(False)
@@ -2316,7 +2506,7 @@ class MainWindow(QMainWindow):
         log_layout.addWidget(log_title)
         self.log_box = QPlainTextEdit(self)
         self.log_box.setReadOnly(True)
-        self.log_box.setMaximumBlockCount(400)
+        self.log_box.setMaximumBlockCount(self._LOG_MAX_BLOCKS)
         self.log_box.setPlaceholderText("Здесь будет журнал операций и проверок...")
         log_layout.addWidget(self.log_box)
 
@@ -2487,6 +2677,8 @@ class MainWindow(QMainWindow):
     def _set_debug_log_enabled(self, enabled: bool) -> None:
         self.debug_log_enabled = bool(enabled)
         self.debug_toggle_btn.setText("LOG ON" if self.debug_log_enabled else "LOG")
+        if self.debug_log_enabled:
+            self._flush_pending_log()
         self.log_card.setVisible(self.debug_log_enabled)
         self._apply_db_columns_visibility()
         if self.debug_log_enabled:
@@ -2504,7 +2696,7 @@ class MainWindow(QMainWindow):
 
     def _on_payment_changed(self) -> None:
         self.app_settings.payment_type = self._selected_data(self.payment_combo, self.app_settings.payment_type)
-        self._save_settings(silent=True)
+        self._mark_settings_dirty()
 
     def _on_supplier_changed(self) -> None:
         if self.supplier_combo.count() == 0:
@@ -2535,6 +2727,8 @@ class MainWindow(QMainWindow):
         return box
 
     def _save_settings(self, *, silent: bool = False) -> None:
+        self._settings_dirty = False
+        self._settings_flush_timer.stop()
         try:
             path = save_app_settings(self.app_settings)
             if not silent:
@@ -2543,11 +2737,16 @@ class MainWindow(QMainWindow):
             if not silent:
                 self._error("Не удалось сохранить настройки", exc=exc)
 
+    def _mark_settings_dirty(self) -> None:
+        self._settings_dirty = True
+        self._settings_flush_timer.start()
+
+    def _flush_settings(self) -> None:
+        if self._settings_dirty:
+            self._save_settings(silent=True)
+
     def _update_cache_dir(self) -> Path:
-        appdata = os.environ.get("LOCALAPPDATA") or os.environ.get("APPDATA")
-        if appdata:
-            return Path(appdata) / "Dazzle" / "updates"
-        return Path.home() / "Dazzle" / "updates"
+        return _update_cache_dir_impl()
 
     def _check_for_updates(
         self,
@@ -2570,15 +2769,24 @@ class MainWindow(QMainWindow):
                 )
             return
 
-        try:
-            update = check_for_update(APP_VERSION, manifest_url)
-        except UpdateError as exc:
-            if interactive:
-                QMessageBox.warning(self, "Обновления", f"Не удалось проверить обновления:\n{exc}")
-            else:
-                if self.debug_log_enabled:
-                    self._log(f"Проверка обновлений: ошибка: {exc}")
-            return
+        # Автоматическая проверка при запуске берёт недавний результат из кэша;
+        # по кнопке «Проверить» всегда идём в сеть.
+        cache_path = self._update_cache_dir() / UPDATE_CHECK_CACHE_NAME
+        cached = False
+        update: UpdateInfo | None = None
+        if not interactive:
+            cached, update = load_cached_update_check(cache_path, manifest_url, APP_VERSION)
+        if not cached:
+            try:
+                update = check_for_update(APP_VERSION, manifest_url)
+            except UpdateError as exc:
+                if interactive:
+                    QMessageBox.warning(self, "Обновления", f"Не удалось проверить обновления:\n{exc}")
+                else:
+                    if self.debug_log_enabled:
+                        self._log(f"Проверка обновлений: ошибка: {exc}")
+                return
+            save_update_check(cache_path, manifest_url, APP_VERSION, update)
 
         if update is None:
             if interactive:
@@ -2614,7 +2822,7 @@ class MainWindow(QMainWindow):
         clicked = dialog.clickedButton()
         if clicked == btn_ignore:
             self.app_settings.ignored_update_version = update.version
-            self._save_settings(silent=True)
+            self._mark_settings_dirty()
             self._log(f"Версия {update.version} помечена как пропущенная.")
             return
         if clicked == btn_later:
@@ -2740,79 +2948,172 @@ class MainWindow(QMainWindow):
         return f"{size:.1f} {units[unit_idx]}"
 
     def _reset_history(self) -> None:
+        self._history_record_timer.stop()
         self._history.clear()
+        self._history_lines = []
         self._history_index = -1
         self._update_history_buttons()
 
+    @staticmethod
+    def _history_diff(
+        before: list[InvoiceLine], after: list[InvoiceLine]
+    ) -> tuple[int, int, int] | None:
+        # Общие начало и конец списков не сохраняем: в истории остаётся
+        # только изменившийся диапазон строк.
+        limit = min(len(before), len(after))
+        start = 0
+        while start < limit and (before[start] is after[start] or before[start] == after[start]):
+            start += 1
+        if start == len(before) == len(after):
+            return None
+        end_before = len(before)
+        end_after = len(after)
+        while (
+            end_before > start
+            and end_after > start
+            and (
+                before[end_before - 1] is after[end_after - 1]
+                or before[end_before - 1] == after[end_after - 1]
+            )
+        ):
+            end_before -= 1
+            end_after -= 1
+        return start, end_before, end_after
+
+    def _schedule_history_record(self) -> None:
+        self._history_record_timer.start()
+        self._update_history_buttons()
+
+    def _flush_history_record(self) -> None:
+        if self._history_record_timer.isActive():
+            self._record_history_state()
+
     def _record_history_state(self, *, force: bool = False) -> None:
-        if self.current_invoice is None or self._history_restoring:
+        self._history_record_timer.stop()
+        if self.current_invoice is None:
             self._update_history_buttons()
             return
 
-        snapshot = copy.deepcopy(self.current_invoice.lines)
-        if (
-            not force
-            and self._history_index >= 0
-            and self._history_index < len(self._history)
-            and self._history[self._history_index] == snapshot
-        ):
+        lines = self.current_invoice.lines
+        if self._history_index < 0:
+            self._history.clear()
+            self._history_lines = pickle.loads(_pickle_dumps(lines))
+            self._history_index = 0
             self._update_history_buttons()
             return
 
-        if self._history_index + 1 < len(self._history):
-            self._history = self._history[: self._history_index + 1]
-
-        self._history.append(snapshot)
-        if len(self._history) > MAX_HISTORY_STATES:
-            overflow = len(self._history) - MAX_HISTORY_STATES
-            self._history = self._history[overflow:]
-            self._history_index = max(-1, self._history_index - overflow)
+        diff = self._history_diff(self._history_lines, lines)
+        if diff is None and not force:
+            self._update_history_buttons()
+            return
 
-        self._history_index = len(self._history) - 1
+        while len(self._history) > self._history_index:
+            self._history.pop()
+
+        snapshot = self._history_lines
+        entry = _HistoryEntry()
+        if diff is not None:
+            start, end_before, end_after = diff
+            if end_before == end_after:
+                # Строки только изменились (правка ячеек, цены, действия):
+                # храним старые и новые значения изменившихся полей.
+                for row in range(start, end_before):
+                    frozen = snapshot[row]
+                    line = lines[row]
+                    if frozen is line or frozen == line:
+                        continue
+                    old_fields: dict[str, object] = {}
+                    new_fields: dict[str, object] = {}
+                    for name in _INVOICE_LINE_FIELDS:
+                        old_value = getattr(frozen, name)
+                        new_value = getattr(line, name)
+                        if old_value != new_value:
+                            old_fields[name] = old_value
+                            new_fields[name] = new_value
+                    new_blob = _pickle_dumps(new_fields)
+                    snapshot[row] = replace(frozen, **pickle.loads(new_blob))
+                    entry.patch[row] = (_pickle_dumps(old_fields), new_blob)
+            else:
+                # Строки удалены или добавлены: храним изменившийся диапазон целиком.
+                entry.start = start
+                entry.before_count = end_before - start
+                entry.before = _pack_history_blob(_pickle_dumps(snapshot[start:end_before]))
+                entry.after_count = end_after - start
+                after_raw = _pickle_dumps(lines[start:end_after])
+                entry.after = _pack_history_blob(after_raw)
+                snapshot[start:end_before] = pickle.loads(after_raw)
+
+        self._history.append(entry)
+        self._history_index = len(self._history)
         self._update_history_buttons()
 
     def _restore_history_state(self, index: int) -> None:
-        if self.current_invoice is None:
+        if self.current_invoice is None or self._history_index < 0:
             return
-        if index < 0 or index >= len(self._history):
+        if index < 0 or index > len(self._history) or index == self._history_index:
             return
-        self._history_restoring = True
-        try:
-            self._history_index = index
-            self.current_invoice.lines = copy.deepcopy(self._history[index])
-            self._populate_table(self.current_invoice.lines)
-        finally:
-            self._history_restoring = False
+        with QSignalBlocker(self.table):
+            lines = self.current_invoice.lines
+            snapshot = self._history_lines
+            while self._history_index > index:
+                self._history_index -= 1
+                entry = self._history[self._history_index]
+                for row, (old_blob, _new_blob) in entry.patch.items():
+                    self._apply_history_fields(row, old_blob)
+                if entry.before_count or entry.after_count:
+                    stop = entry.start + entry.after_count
+                    before_raw = _unpack_history_blob(entry.before)
+                    snapshot[entry.start : stop] = pickle.loads(before_raw)
+                    lines[entry.start : stop] = pickle.loads(before_raw)
+            while self._history_index < index:
+                entry = self._history[self._history_index]
+                if entry.before_count or entry.after_count:
+                    stop = entry.start + entry.before_count
+                    after_raw = _unpack_history_blob(entry.after)
+                    snapshot[entry.start : stop] = pickle.loads(after_raw)
+                    lines[entry.start : stop] = pickle.loads(after_raw)
+                for row, (_old_blob, new_blob) in entry.patch.items():
+                    self._apply_history_fields(row, new_blob)
+                self._history_index += 1
+            self._populate_table(lines)
         self._update_history_buttons()
 
+    def _apply_history_fields(self, row: int, blob: bytes) -> None:
+        assert self.current_invoice is not None
+        values = pickle.loads(blob)
+        self._history_lines[row] = replace(self._history_lines[row], **values)
+        # Неизменяемые значения (числа, строки) можно разделить между эталоном
+        # и рабочей строкой; словари и списки рабочая строка получает своими.
+        if any(isinstance(value, (dict, list, set)) for value in values.values()):
+            values = pickle.loads(blob)
+        line = self.current_invoice.lines[row]
+        for name, value in values.items():
+            setattr(line, name, value)
+
     def _undo_history(self) -> None:
+        self._flush_history_record()
         if self._history_index <= 0:
             return
         self._restore_history_state(self._history_index - 1)
         self._log("Отмена последнего действия выполнена.")
 
     def _redo_history(self) -> None:
-        if self._history_index < 0 or self._history_index + 1 >= len(self._history):
+        self._flush_history_record()
+        if self._history_index < 0 or self._history_index >= len(self._history):
             return
         self._restore_history_state(self._history_index + 1)
         self._log("Повтор действия выполнен.")
 
     def _update_history_buttons(self) -> None:
-        history_len = len(self._history)
-        if history_len <= 1:
-            can_undo = False
-            can_redo = False
-        else:
-            can_undo = self._history_index > 0
-            can_redo = self._history_index >= 0 and self._history_index + 1 < history_len
+        pending = self._history_record_timer.isActive()
+        can_undo = self._history_index > 0 or (pending and self._history_index >= 0)
+        can_redo = not pending and 0 <= self._history_index < len(self._history)
         if hasattr(self, "undo_btn"):
             self.undo_btn.setEnabled(can_undo)
         if hasattr(self, "redo_btn"):
             self.redo_btn.setEnabled(can_redo)
 
     def _on_table_header_layout_changed(self, *_args) -> None:
-        if self._restoring_header_state:
-            return
         self._column_layout_initialized = True
         self._column_state_save_timer.start()
 
@@ -2821,49 +3122,74 @@ class MainWindow(QMainWindow):
         if not raw_state:
             return
         restored = False
-        self._restoring_header_state = True
         try:
-            state = QByteArray.fromBase64(raw_state.encode("ascii"))
-            if not state.isEmpty():
-                restored = self.table.horizontalHeader().restoreState(state)
+            raw = base64.b64decode(raw_state.encode("ascii"))
+            if raw:
+                with QSignalBlocker(self.table.horizontalHeader()):
+                    restored = self.table.horizontalHeader().restoreState(QByteArray(raw))
+        except (binascii.Error, ValueError) as exc:
+            self._log(f"Предупреждение: сохранённое расположение столбцов повреждено: {exc}")
         except Exception as exc:
             self._log(f"Предупреждение: не удалось восстановить расположение столбцов: {exc}")
-        finally:
-            self._restoring_header_state = False
         if restored:
+            self._header_state_cache = (raw, raw_state)
             self._column_layout_initialized = True
             self._apply_db_columns_visibility()
 
     def _save_table_header_state(self, *, silent: bool = True) -> None:
         try:
-            state = self.table.horizontalHeader().saveState()
-            encoded = bytes(state.toBase64()).decode("ascii")
+            raw = bytes(self.table.horizontalHeader().saveState())
         except Exception as exc:
             if not silent:
                 self._error("Не удалось сохранить расположение столбцов", exc=exc)
             return
+        cached = self._header_state_cache
+        if (
+            cached is not None
+            and cached[0] == raw
+            and cached[1] == self.app_settings.table_header_state
+        ):
+            return
+        encoded = base64.b64encode(raw).decode("ascii")
+        self._header_state_cache = (raw, encoded)
         if encoded == self.app_settings.table_header_state:
             return
         self.app_settings.table_header_state = encoded
-        self._save_settings(silent=silent)
+        if silent:
+            self._mark_settings_dirty()
+        else:
+            self._save_settings(silent=False)
 
     def _apply_settings_to_runtime_controls(self) -> None:
-        self.create_missing_cb.setChecked(self.app_settings.create_missing_goods)
-        self.update_goods_card_cb.setChecked(self.app_settings.update_existing_sell_price)
-        self.update_buy_price_cb.setChecked(self.app_settings.update_existing_buy_price)
-        self.auto_pay_cb.setChecked(False)
-        self.auto_pay_cb.setEnabled(False)
-        self.backup_cb.setChecked(self.app_settings.backup_before_import)
-
-        combos = (
-            (self.user_combo, self.app_settings.user_id),
-            (self.shop_combo, self.app_settings.shop_id),
-            (self.payment_combo, self.app_settings.payment_type),
-        )
-        for combo, target in combos:
-            combo.blockSignals(True)
-            self._set_combo_by_data(combo, target)
-            combo.blockSignals(False)
+        # Программная установка значений не должна запускать обработчики
+        # (сохранение настроек, перезагрузку каталога): каталог перечитывают вызывающие.
+        blockers = [
+            QSignalBlocker(widget)
+            for widget in (
+                self.create_missing_cb,
+                self.update_goods_card_cb,
+                self.update_buy_price_cb,
+                self.auto_pay_cb,
+                self.backup_cb,
+                self.user_combo,
+                self.shop_combo,
+                self.payment_combo,
+            )
+        ]
+        try:
+            self.create_missing_cb.setChecked(self.app_settings.create_missing_goods)
+            self.update_goods_card_cb.setChecked(self.app_settings.update_existing_sell_price)
+            self.update_buy_price_cb.setChecked(self.app_settings.update_existing_buy_price)
+            self.auto_pay_cb.setChecked(False)
+            self.auto_pay_cb.setEnabled(False)
+            self.backup_cb.setChecked(self.app_settings.backup_before_import)
+
+            self._set_combo_by_data(self.user_combo, self.app_settings.user_id)
+            self._set_combo_by_data(self.shop_combo, self.app_settings.shop_id)
+            self._set_combo_by_data(self.payment_combo, self.app_settings.payment_type)
+        finally:
+            for blocker in blockers:
+                blocker.unblock()
         self._refresh_apply_markup_button_text()
 
     def _refresh_apply_markup_button_text(self) -> None:
@@ -2874,14 +3200,13 @@ class MainWindow(QMainWindow):
 
     @staticmethod
     def _set_combo_by_data(combo: QComboBox, target: int) -> None:
-        for idx in range(combo.count()):
-            data = combo.itemData(idx)
-            if data is not None and int(data) == int(target):
-                combo.setCurrentIndex(idx)
-                return
+        _set_combo_by_id(combo, target)
 
     @staticmethod
     def _combo_id_name_pairs(combo: QComboBox) -> list[tuple[int, str]]:
+        pairs = getattr(combo, "_id_name_pairs", None)
+        if pairs is not None:
+            return list(pairs)
         out: list[tuple[int, str]] = []
         for idx in range(combo.count()):
             data = combo.itemData(idx)
@@ -2912,19 +3237,28 @@ class MainWindow(QMainWindow):
             self.invoice_file_combo.addItem("Папка не найдена", userData="")
             return
 
-        files = [
-            p
-            for p in invoices_dir.iterdir()
-            if p.is_file() and p.suffix.lower() in {".xls", ".xlsx"}
-        ]
-        files.sort(key=lambda p: p.stat().st_mtime, reverse=True)
+        # os.scandir отдаёт тип и (на Windows) время изменения вместе со списком
+        # файлов: на сетевых папках это заметно быстрее отдельных stat() на файл.
+        files: list[tuple[float, str, str]] = []
+        with os.scandir(invoices_dir) as entries:
+            for entry in entries:
+                if os.path.splitext(entry.name)[1].lower() not in {".xls", ".xlsx"}:
+                    continue
+                if not entry.is_file():
+                    continue
+                files.append((entry.stat().st_mtime, entry.name, entry.path))
+        files.sort(key=lambda item: item[0], reverse=True)
 
         if not files:
             self.invoice_file_combo.addItem("Excel-файлы не найдены", userData="")
             return
 
-        for file in files:
-            self.invoice_file_combo.addItem(file.name, userData=str(file))
+        self.invoice_file_combo.setUpdatesEnabled(False)
+        try:
+            for _mtime, name, path in files:
+                self.invoice_file_combo.addItem(name, userData=path)
+        finally:
+            self.invoice_file_combo.setUpdatesEnabled(True)
 
     def _open_settings_dialog(self) -> None:
         if self._is_ui_busy():
@@ -2986,9 +3320,7 @@ class MainWindow(QMainWindow):
             return
         if not (self.suppliers and self.users and self.shops):
             try:
-                self.suppliers = self.db.list_suppliers()
-                self.users = self.db.list_users()
-                self.shops = self.db.list_shops()
+                self.suppliers, self.users, self.shops = self.db.list_reference_data()
             except Exception:
                 return
         try:
@@ -3078,9 +3410,7 @@ class MainWindow(QMainWindow):
             return
         if not self.suppliers or not self.users or not self.shops:
             try:
-                self.suppliers = self.db.list_suppliers()
-                self.users = self.db.list_users()
-                self.shops = self.db.list_shops()
+                self.suppliers, self.users, self.shops = self.db.list_reference_data()
             except Exception as exc:
                 self._error("Не удалось загрузить справочники для Ozon", exc=exc)
                 return
@@ -3115,6 +3445,7 @@ class MainWindow(QMainWindow):
             self._save_settings(silent=True)
 
         self._set_ui_busy(True, "Подключение к базе...")
+        self._db_open_stamp = _db_file_stamp(db_path)
         self._db_open_thread = QThread(self)
         self._db_open_worker = DbOpenWorker(
             db_path=db_path,
@@ -3134,9 +3465,7 @@ class MainWindow(QMainWindow):
         if self.db is None:
             return
 
-        suppliers = self.db.list_suppliers()
-        users = self.db.list_users()
-        shops = self.db.list_shops()
+        suppliers, users, shops = self.db.list_reference_data()
         self._apply_reference_data(suppliers, users, shops)
         self._reload_catalog()
 
@@ -3149,9 +3478,18 @@ class MainWindow(QMainWindow):
         self.suppliers = list(suppliers)
         self.users = list(users)
         self.shops = list(shops)
-        self.supplier_combo.clear()
-        for supplier_id, name in suppliers:
-            self.supplier_combo.addItem(f"{name} [{supplier_id}]", userData=supplier_id)
+        _fill_id_combo(self.supplier_combo, suppliers)
+        # Нормализованные имена поставщиков для автоопределения по накладной,
+        # в порядке пунктов supplier_combo.
+        self._supplier_hint_names = [
+            (norm, frozenset(norm.split()), len(norm))
+            for norm in (_normalize_supplier_name(name) for _supplier_id, name in suppliers)
+        ]
+        # Точное совпадение имени — первый такой пункт, как и при полном переборе.
+        self._supplier_exact_index = {}
+        for idx, (norm, _tokens, _name_len) in enumerate(self._supplier_hint_names):
+            if norm:
+                self._supplier_exact_index.setdefault(norm, idx)
         if self.supplier_combo.count() > 0:
             supplier_name = _extract_supplier_name(self.supplier_combo.currentText())
             self.supplier_detect_label.setText(
@@ -3160,15 +3498,8 @@ class MainWindow(QMainWindow):
         else:
             self.supplier_detect_label.setText("Поставщики в базе не найдены")
 
-        self.user_combo.clear()
-        for user_id, name in users:
-            self.user_combo.addItem(f"{name} [{user_id}]", userData=user_id)
-
-        self.shop_combo.blockSignals(True)
-        self.shop_combo.clear()
-        for shop_id, name in shops:
-            self.shop_combo.addItem(f"{name} [{shop_id}]", userData=shop_id)
-        self.shop_combo.blockSignals(False)
+        _fill_id_combo(self.user_combo, users)
+        _fill_id_combo(self.shop_combo, shops)
         self._apply_settings_to_runtime_controls()
 
     def _on_db_open_finished(self, payload: object) -> None:
@@ -3190,7 +3521,13 @@ class MainWindow(QMainWindow):
                 catalog,
                 article_match_field=self.app_settings.article_match_field,
             )
-            self._save_settings(silent=True)
+            self._loaded_catalog_shop_id = effective_shop_id
+            if self._db_open_stamp is not None:
+                self._remember_catalog(
+                    (str(self.db.db_path), self._db_open_stamp, effective_shop_id),
+                    catalog,
+                )
+            self._mark_settings_dirty()
 
             self._log(f"База открыта: {self.app_settings.db_path}")
             self._log(f"Каталог загружен: {len(catalog)} товаров.")
@@ -3240,6 +3577,16 @@ class MainWindow(QMainWindow):
             db_path = db_path / "shop.db"
         self._set_ui_busy(True, "Обновление каталога...")
         shop_id = self._selected_data(self.shop_combo, 0)
+        stamp = _db_file_stamp(db_path)
+        key = (str(db_path), stamp, shop_id) if stamp is not None else None
+        cached = self._catalog_cache.get(key) if key is not None else None
+        if cached is not None:
+            self._catalog_cache.move_to_end(key)
+            self._on_catalog_loaded(
+                {"shop_id": shop_id, "catalog": cached, "run_matching_after": run_matching_after}
+            )
+            return
+        self._catalog_load_key = key
         self._catalog_load_thread = QThread(self)
         self._catalog_load_worker = CatalogLoadWorker(
             db_path=db_path,
@@ -3266,7 +3613,11 @@ class MainWindow(QMainWindow):
                 catalog,
                 article_match_field=self.app_settings.article_match_field,
             )
-            self._save_settings(silent=True)
+            self._loaded_catalog_shop_id = shop_id
+            if self._catalog_load_key is not None:
+                self._remember_catalog(self._catalog_load_key, catalog)
+                self._catalog_load_key = None
+            self._mark_settings_dirty()
             self._log(f"Каталог загружен: {len(catalog)} товаров.")
             if bool(data.get("run_matching_after", False)) and self.current_invoice is not None:
                 self._run_matching()
@@ -3276,7 +3627,18 @@ class MainWindow(QMainWindow):
         finally:
             self._set_ui_busy(False)
 
+    def _remember_catalog(
+        self,
+        key: tuple[str, tuple[int, int], int],
+        catalog: dict[int, GoodRecord],
+    ) -> None:
+        self._catalog_cache[key] = catalog
+        self._catalog_cache.move_to_end(key)
+        while len(self._catalog_cache) > MAX_CACHED_CATALOGS:
+            self._catalog_cache.popitem(last=False)
+
     def _on_catalog_load_failed(self, message: str) -> None:
+        self._catalog_load_key = None
         self._error(f"Ошибка загрузки каталога: {message}")
         self._set_ui_busy(False)
 
@@ -3289,10 +3651,13 @@ class MainWindow(QMainWindow):
             self._catalog_load_thread = None
 
     def _on_shop_changed(self) -> None:
-        self.app_settings.shop_id = self._selected_data(self.shop_combo, self.app_settings.shop_id)
-        self._save_settings(silent=True)
+        shop_id = self._selected_data(self.shop_combo, self.app_settings.shop_id)
+        self.app_settings.shop_id = shop_id
+        self._mark_settings_dirty()
         if self.db is None:
             return
+        if self.matcher is not None and shop_id == self._loaded_catalog_shop_id:
+            return
         self._reload_catalog(run_matching_after=self.current_invoice is not None)
 
     def _load_invoice(self) -> None:
@@ -3387,6 +3752,7 @@ class MainWindow(QMainWindow):
             return
 
         self._set_ui_busy(True, "Сопоставление товаров...")
+        self._match_snapshots = [self._snapshot_match_state(line) for line in self.current_invoice.lines]
         self._match_thread = QThread(self)
         self._match_worker = MatchWorker(
             matcher=self.matcher,
@@ -3406,8 +3772,24 @@ class MainWindow(QMainWindow):
     def _on_matching_finished(self, payload: object) -> None:
         try:
             data = payload if isinstance(payload, dict) else {}
+            before, self._match_snapshots = self._match_snapshots, None
             if self.current_invoice is not None:
-                self._populate_table(self.current_invoice.lines)
+                lines = self.current_invoice.lines
+                if (
+                    before is None
+                    or len(before) != len(lines)
+                    or self._populated_settings_key != self._table_settings_key()
+                ):
+                    self._populate_table(lines)
+                else:
+                    # Перерисовываем только строки, которые сопоставление изменило.
+                    changed: list[int] = []
+                    for row, line in enumerate(lines):
+                        self._refresh_line_price_state(line)
+                        if self._snapshot_match_state(line) != before[row]:
+                            changed.append(row)
+                    if changed:
+                        self._repopulate_rows(changed)
                 if bool(data.get("record_history", True)):
                     self._record_history_state()
             line_count = int(data.get("line_count", 0) or 0)
@@ -3418,6 +3800,7 @@ class MainWindow(QMainWindow):
             self._set_ui_busy(False)
 
     def _on_matching_failed(self, message: str) -> None:
+        self._match_snapshots = None
         self._error(f"Ошибка сопоставления: {message}")
         self._set_ui_busy(False)
 
@@ -3448,7 +3831,7 @@ class MainWindow(QMainWindow):
         try:
             self.matcher.apply_manual_good(line, dialog.selected_good_id)
             line.action = "import"
-            line.raw_data["_manual_edited"] = True
+            line.flags |= LINE_FLAG_MANUAL_EDITED
             self._populate_table(self.current_invoice.lines)
             self._record_history_state()
             self._log(f"Строка {line.line_no}: вручную выбран good_id={dialog.selected_good_id}.")
@@ -3475,11 +3858,18 @@ class MainWindow(QMainWindow):
             self._log("Нет строк для применения рассчитанной цены.")
             return
 
+        lines = self.current_invoice.lines
+        suggested_prices = suggested_sell_prices(
+            [lines[row].price for row in target_rows],
+            markup_percent=self.app_settings.markup_percent,
+            round_step=self.app_settings.round_step,
+        ).tolist()
+
         changed = 0
         marked_for_db = 0
-        for row in target_rows:
-            line = self.current_invoice.lines[row]
-            self._refresh_line_price_state(line)
+        for row, suggested in zip(target_rows, suggested_prices):
+            line = lines[row]
+            self._refresh_line_price_state(line, suggested=suggested)
             if line.suggested_sell_price is None:
                 continue
 
@@ -3487,17 +3877,17 @@ class MainWindow(QMainWindow):
                 line.existing_sell_price is not None
                 and abs(line.existing_sell_price - line.suggested_sell_price) > 0.0001
             ):
-                if not line.raw_data.get("_force_update_sell_price", False):
+                if not line.flags & LINE_FLAG_FORCE_UPDATE_SELL_PRICE:
                     marked_for_db += 1
-                line.raw_data["_force_update_sell_price"] = True
-                line.raw_data["_price_applied"] = True
+                line.flags |= LINE_FLAG_FORCE_UPDATE_SELL_PRICE
+                line.flags |= LINE_FLAG_PRICE_APPLIED
 
             if line.sell_price is None or abs(line.sell_price - line.suggested_sell_price) > 0.0001:
                 line.sell_price = line.suggested_sell_price
-                line.raw_data["_sell_initialized"] = True
-                line.raw_data["_price_applied"] = True
+                line.flags |= LINE_FLAG_SELL_INITIALIZED
+                line.flags |= LINE_FLAG_PRICE_APPLIED
                 changed += 1
-                self._refresh_line_price_state(line)
+                self._refresh_line_price_state(line, suggested=suggested)
 
         self._populate_table(self.current_invoice.lines)
         if changed > 0 or marked_for_db > 0:
@@ -3704,143 +4094,16 @@ class MainWindow(QMainWindow):
             sorting_was_enabled = self.table.isSortingEnabled()
             self.table.setSortingEnabled(False)
             self.table.setRowCount(len(lines))
+            self._refresh_all_line_price_states(lines)
             for row, line in enumerate(lines):
-                self._refresh_line_price_state(line)
-                sell_price = line.sell_price if line.sell_price is not None else line.price
-                sell_old = self._display_sell_price_in_db(line)
-                diff_pct = line.sell_price_diff_percent
-                markup_price = sell_old if sell_old is not None else sell_price
-                markup_pct = self._calculate_markup_percent(
-                    buy_price=line.price,
-                    sell_price=markup_price,
-                )
-                values = [
-                    str(line.line_no),
-                    line.article,
-                    line.name,
-                    line.note,
-                    _fmt_number(line.quantity, 3),
-                    _fmt_number(line.price, 2),
-                    _fmt_number(line.total, 2),
-                    _fmt_number(sell_price, 2),
-                    _fmt_number(sell_old, 2) if sell_old is not None else "",
-                    _fmt_number(diff_pct, 1) if diff_pct is not None else "",
-                    _fmt_number(markup_pct, 1) if markup_pct is not None else "",
-                    self._status_text(line.match_status),
-                    "",
-                    str(line.matched_good_id or ""),
-                    line.matched_product_code or line.article,
-                    line.matched_name or line.name,
-                    line.similar_articles,
-                    line.match_method,
-                    self._display_warning(line),
-                ]
-                for col, value in enumerate(values):
-                    item = QTableWidgetItem(value)
-                    if col in MONO_COLUMNS:
-                        mono = item.font()
-                        mono.setFamily("Consolas")
-                        item.setFont(mono)
-                    if col in {
-                        COL_LINE,
-                        COL_QTY,
-                        COL_BUY_PRICE,
-                        COL_SELL_PRICE,
-                        COL_SELL_PRICE_OLD,
-                        COL_SELL_DIFF,
-                        COL_MARKUP,
-                        COL_SUM,
-                        COL_GOOD_ID,
-                    }:
-                        item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
-                    if col in {
-                        COL_LINE,
-                        COL_STATUS,
-                        COL_METHOD,
-                        COL_SELL_DIFF,
-                        COL_MARKUP,
-                        COL_SIMILAR,
-                        COL_WARNING,
-                    }:
-                        item.setFlags(item.flags() & ~Qt.ItemIsEditable)
-                    if col in {COL_STATUS, COL_WARNING, COL_GOOD_CODE, COL_GOOD_NAME, COL_METHOD}:
-                        item.setForeground(QColor(20, 20, 20))
-                    if col == COL_SELL_PRICE_OLD:
-                        old_db_price = line.existing_sell_price
-                        show_db_price = sell_old
-                        if (
-                            old_db_price is not None
-                            and show_db_price is not None
-                            and abs(show_db_price - old_db_price) > 0.0001
-                        ):
-                            item.setData(ROLE_SELL_DB_OLD_PRICE, _fmt_number(old_db_price, 2))
-                        else:
-                            item.setData(ROLE_SELL_DB_OLD_PRICE, "")
-                    if col == COL_STATUS:
-                        font = item.font()
-                        font.setBold(True)
-                        item.setFont(font)
-                    self.table.setItem(row, col, item)
-
-                status_color = self._status_color(line.match_status)
-                if status_color:
-                    for col in (COL_STATUS, COL_GOOD_ID, COL_GOOD_CODE, COL_GOOD_NAME):
-                        item = self.table.item(row, col)
-                        if item is not None:
-                            item.setBackground(status_color)
-                            item.setForeground(QColor(20, 20, 20))
-
-                if line.price_alert:
-                    for col in (COL_SELL_PRICE, COL_SELL_PRICE_OLD, COL_SELL_DIFF, COL_MARKUP):
-                        item = self.table.item(row, col)
-                        if item is not None:
-                            item.setBackground(QColor(255, 184, 184))
-                            item.setForeground(QColor(92, 0, 0))
-                elif line.raw_data.get("_price_applied", False):
-                    for col in (COL_SELL_PRICE, COL_SELL_PRICE_OLD, COL_SELL_DIFF, COL_MARKUP):
-                        item = self.table.item(row, col)
-                        if item is not None:
-                            item.setBackground(QColor(221, 236, 255))
-
-                if bool(line.raw_data.get("_cancelled_in_invoice", False)):
-                    note_item = self.table.item(row, COL_NOTE)
-                    if note_item is not None:
-                        font = note_item.font()
-                        font.setBold(True)
-                        note_item.setFont(font)
-                        note_item.setForeground(QColor(190, 18, 18))
-
-                if line.raw_data.get("_manual_edited", False):
-                    for col in (COL_ARTICLE, COL_NAME, COL_NOTE, COL_QTY, COL_BUY_PRICE, COL_SUM):
-                        item = self.table.item(row, col)
-                        if item is not None:
-                            item.setBackground(QColor(232, 243, 255))
-                    if not line.price_alert:
-                        sell_item = self.table.item(row, COL_SELL_PRICE)
-                        if sell_item is not None:
-                            sell_item.setBackground(QColor(232, 243, 255))
-
-                combo = QComboBox(self.table)
-                combo.addItem("import")
-                combo.addItem("create")
-                combo.addItem("skip")
-                combo.setFixedHeight(24)
-                action = line.action if line.action in {"import", "create", "skip"} else "skip"
-                combo.setCurrentText(action)
-                self._apply_action_combo_visual(combo, action)
-                combo.currentTextChanged.connect(
-                    lambda val, row_idx=row: self._on_action_changed(row_idx, val)
-                )
-                self.table.setCellWidget(row, COL_ACTION, combo)
+                self._fill_table_row(row, line)
 
-            self.invoice_totals_label.setText(self._build_invoice_totals(lines))
-            self._update_footer_metrics(lines)
+            self._populated_settings_key = self._table_settings_key()
+            # Итоги и счётчики внизу обновит _apply_table_filter ниже.
+            self._invoice_arrays = InvoiceArrays.from_lines(lines)
             if lines and not self._column_layout_initialized:
-                self._restoring_header_state = True
-                try:
+                with QSignalBlocker(self.table.horizontalHeader()):
                     self._apply_initial_column_widths(lines)
-                finally:
-                    self._restoring_header_state = False
                 self._column_layout_initialized = True
                 self._save_table_header_state(silent=True)
             self._apply_table_filter()
@@ -3852,6 +4115,176 @@ class MainWindow(QMainWindow):
             self.table.viewport().update()
             self._table_locked = False
 
+    def _fill_table_row(self, row: int, line: InvoiceLine) -> None:
+        sell_price = line.sell_price if line.sell_price is not None else line.price
+        sell_old = self._display_sell_price_in_db(line)
+        diff_pct = line.sell_price_diff_percent
+        markup_price = sell_old if sell_old is not None else sell_price
+        markup_pct = self._calculate_markup_percent(
+            buy_price=line.price,
+            sell_price=markup_price,
+        )
+        fmt = _fmt_number
+        values = (
+            str(line.line_no),
+            line.article,
+            line.name,
+            line.note,
+            fmt(line.quantity, 3),
+            fmt(line.price, 2),
+            fmt(line.total, 2),
+            fmt(sell_price, 2),
+            fmt(sell_old, 2) if sell_old is not None else "",
+            fmt(diff_pct, 1) if diff_pct is not None else "",
+            fmt(markup_pct, 1) if markup_pct is not None else "",
+            self._status_text(line.match_status),
+            line.action if line.action in LINE_ACTIONS else "skip",  # COL_ACTION
+            str(line.matched_good_id or ""),
+            line.matched_product_code or line.article,
+            line.matched_name or line.name,
+            line.similar_articles,
+            line.match_method,
+            self._display_warning(line),
+        )
+
+        # Цвета ячеек строки считаем заранее и назначаем в том же проходе,
+        # где создаются элементы, без повторных table.item().
+        col_bg: dict[int, QColor] = {}
+        col_fg: dict[int, QColor] = {}
+        status_color = self._status_color(line.match_status)
+        if status_color:
+            for col in (COL_STATUS, COL_GOOD_ID, COL_GOOD_CODE, COL_GOOD_NAME):
+                col_bg[col] = status_color
+                col_fg[col] = self._TEXT_DARK
+        if line.price_alert:
+            for col in (COL_SELL_PRICE, COL_SELL_PRICE_OLD, COL_SELL_DIFF, COL_MARKUP):
+                col_bg[col] = self._PRICE_ALERT_BG
+                col_fg[col] = self._PRICE_ALERT_FG
+        elif line.flags & LINE_FLAG_PRICE_APPLIED:
+            for col in (COL_SELL_PRICE, COL_SELL_PRICE_OLD, COL_SELL_DIFF, COL_MARKUP):
+                col_bg[col] = self._PRICE_APPLIED_BG
+        cancelled = bool(line.raw_data.get("_cancelled_in_invoice", False))
+        if cancelled:
+            col_fg[COL_NOTE] = self._CANCELLED_NOTE_FG
+        if line.flags & LINE_FLAG_MANUAL_EDITED:
+            for col in (COL_ARTICLE, COL_NAME, COL_NOTE, COL_QTY, COL_BUY_PRICE, COL_SUM):
+                col_bg[col] = self._MANUAL_EDIT_BG
+            if not line.price_alert:
+                col_bg[COL_SELL_PRICE] = self._MANUAL_EDIT_BG
+
+        prototypes = self._cell_prototypes()
+        make_item = QTableWidgetItem
+        set_item = self.table.setItem
+        for col, value in enumerate(values):
+            item = make_item(prototypes[col])
+            item.setText(value)
+            bg = col_bg.get(col)
+            if bg is not None:
+                item.setBackground(bg)
+            fg = col_fg.get(col)
+            if fg is not None:
+                item.setForeground(fg)
+            if col == COL_NOTE and cancelled:
+                font = item.font()
+                font.setBold(True)
+                item.setFont(font)
+            if col == COL_SELL_PRICE_OLD:
+                old_db_price = line.existing_sell_price
+                show_db_price = sell_old
+                if (
+                    old_db_price is not None
+                    and show_db_price is not None
+                    and abs(show_db_price - old_db_price) > 0.0001
+                ):
+                    item.setData(ROLE_SELL_DB_OLD_PRICE, _fmt_number(old_db_price, 2))
+                else:
+                    item.setData(ROLE_SELL_DB_OLD_PRICE, "")
+            set_item(row, col, item)
+
+    def _cell_prototypes(self) -> list[QTableWidgetItem]:
+        # Шрифт, выравнивание, флаги и цвет текста у колонки постоянны:
+        # ячейки клонируются из готового образца вместо настройки каждой заново.
+        prototypes = self._cell_prototype_items
+        if prototypes is not None:
+            return prototypes
+        base = QTableWidgetItem()
+        mono_font = base.font()
+        mono_font.setFamily("Consolas")
+        bold_font = base.font()
+        bold_font.setBold(True)
+        prototypes = []
+        for col in range(self.table.columnCount()):
+            item = QTableWidgetItem()
+            if col in MONO_COLUMNS:
+                item.setFont(mono_font)
+            if col == COL_STATUS:
+                item.setFont(bold_font)
+            if col in RIGHT_ALIGNED_COLUMNS:
+                item.setTextAlignment(self._ALIGN_RIGHT)
+            if col in READ_ONLY_COLUMNS:
+                item.setFlags(item.flags() & self._READ_ONLY_MASK)
+            if col in DARK_TEXT_COLUMNS:
+                item.setForeground(self._TEXT_DARK)
+            prototypes.append(item)
+        self._cell_prototype_items = prototypes
+        return prototypes
+
+    def _repopulate_rows(self, rows: list[int]) -> None:
+        if self.current_invoice is None:
+            return
+        lines = self.current_invoice.lines
+        self._table_locked = True
+        table_updates_enabled = self.table.updatesEnabled()
+        table_signals_blocked = self.table.blockSignals(True)
+        self.table.setUpdatesEnabled(False)
+        try:
+            sorting_was_enabled = self.table.isSortingEnabled()
+            self.table.setSortingEnabled(False)
+            for row in rows:
+                if 0 <= row < len(lines):
+                    self._fill_table_row(row, lines[row])
+            arrays = self._invoice_arrays
+            if arrays is not None and len(arrays) == len(lines):
+                arrays.update_rows(lines, rows)
+            else:
+                self._invoice_arrays = InvoiceArrays.from_lines(lines)
+            # Скрытых строк здесь не появляется, поэтому обновляем только итоги.
+            self._refresh_invoice_totals()
+            self.table.setSortingEnabled(sorting_was_enabled)
+        finally:
+            self.table.blockSignals(table_signals_blocked)
+            self.table.setUpdatesEnabled(table_updates_enabled)
+            self.table.viewport().update()
+            self._table_locked = False
+
+    def _table_settings_key(self) -> tuple:
+        # Настройки, от которых зависит отображение цен в таблице.
+        settings = self.app_settings
+        return (
+            settings.markup_percent,
+            settings.round_step,
+            settings.update_existing_sell_price,
+            settings.price_alert_threshold_percent,
+        )
+
+    @staticmethod
+    def _snapshot_match_state(line: InvoiceLine) -> tuple:
+        return (
+            line.match_status,
+            line.matched_good_id,
+            line.matched_product_code,
+            line.matched_name,
+            line.similar_articles,
+            line.match_method,
+            line.warning,
+            line.action,
+            line.sell_price,
+            line.existing_sell_price,
+            line.sell_price_diff_percent,
+            line.price_alert,
+            line.flags,
+        )
+
     def _apply_initial_column_widths(self, lines: list[InvoiceLine]) -> None:
         # Подобранные ширины: рабочие колонки помещаются в окно без
         # горизонтальной прокрутки. Длинный текст аккуратно обрезается «…»,
@@ -3885,154 +4318,182 @@ class MainWindow(QMainWindow):
         if self.current_invoice is None or self.matcher is None:
             return
         for row, line in enumerate(self.current_invoice.lines):
-            before_good_id = line.matched_good_id
-            combo = self.table.cellWidget(row, COL_ACTION)
-            if isinstance(combo, QComboBox):
-                line.action = combo.currentText().strip()
-
-            article = normalize_article(self._item_text(row, COL_ARTICLE))
-            name = normalize_text_field(self._item_text(row, COL_NAME), max_len=120)
-            note = normalize_text_field(self._item_text(row, COL_NOTE), max_len=250)
-            if not article:
-                article = normalize_article(line.article)
-            if not name:
-                name = normalize_text_field(line.name, max_len=120)
-            if strict and not article:
-                raise ImportValidationError(f"Строка {line.line_no}: артикул пустой.")
-            if strict and not name:
-                raise ImportValidationError(f"Строка {line.line_no}: название пустое.")
-
-            qty = self._parse_float_input(
-                self._item_text(row, COL_QTY),
-                line_no=line.line_no,
-                field_name="кол-во",
-                strict=strict,
-                default=line.quantity,
-            )
-            buy_price = self._parse_float_input(
-                self._item_text(row, COL_BUY_PRICE),
-                line_no=line.line_no,
-                field_name="закупка",
-                strict=strict,
-                default=line.price,
-            )
-            sell_price = self._parse_float_input(
-                self._item_text(row, COL_SELL_PRICE),
-                line_no=line.line_no,
-                field_name="продажа",
-                strict=strict,
-                default=line.sell_price if line.sell_price is not None else line.price,
-            )
-            total = self._parse_float_input(
-                self._item_text(row, COL_SUM),
-                line_no=line.line_no,
-                field_name="сумма",
-                strict=False,
-                default=0.0,
-            )
-            if total <= 0:
-                total = round(qty * buy_price, 2)
-
-            line.article = article
-            line.name = name
-            line.note = note
-            line.quantity = qty
-            line.price = buy_price
-            line.sell_price = sell_price
-            line.total = total
-            line.raw_data["_sell_initialized"] = True
-
-            raw_good = self._item_text(row, COL_GOOD_ID)
-            if raw_good:
-                try:
-                    good_id = int(raw_good)
-                except ValueError:
-                    if strict:
-                        raise ImportValidationError(
-                            f"Строка {line.line_no}: некорректный Good ID '{raw_good}'."
-                        ) from None
-                    good_id = -1
-                good = self.matcher.catalog.get(good_id)
-                if good is None and strict:
+            self._sync_line_from_row(row, line, strict=strict)
+
+    def _sync_line_from_row(self, row: int, line: InvoiceLine, *, strict: bool) -> None:
+        assert self.matcher is not None
+        texts = self._row_texts(row)
+        before_good_id = line.matched_good_id
+        action = texts[COL_ACTION]
+        if action in LINE_ACTIONS:
+            line.action = action
+
+        article = normalize_article(texts[COL_ARTICLE])
+        name = normalize_text_field(texts[COL_NAME], max_len=120)
+        note = normalize_text_field(texts[COL_NOTE], max_len=250)
+        if not article:
+            article = normalize_article(line.article)
+        if not name:
+            name = normalize_text_field(line.name, max_len=120)
+        if strict and not article:
+            raise ImportValidationError(f"Строка {line.line_no}: артикул пустой.")
+        if strict and not name:
+            raise ImportValidationError(f"Строка {line.line_no}: название пустое.")
+
+        qty = self._parse_float_input(
+            texts[COL_QTY],
+            line_no=line.line_no,
+            field_name="кол-во",
+            strict=strict,
+            default=line.quantity,
+        )
+        buy_price = self._parse_float_input(
+            texts[COL_BUY_PRICE],
+            line_no=line.line_no,
+            field_name="закупка",
+            strict=strict,
+            default=line.price,
+        )
+        sell_price = self._parse_float_input(
+            texts[COL_SELL_PRICE],
+            line_no=line.line_no,
+            field_name="продажа",
+            strict=strict,
+            default=line.sell_price if line.sell_price is not None else line.price,
+        )
+        total = self._parse_float_input(
+            texts[COL_SUM],
+            line_no=line.line_no,
+            field_name="сумма",
+            strict=False,
+            default=0.0,
+        )
+        if total <= 0:
+            total = round(qty * buy_price, 2)
+
+        line.article = article
+        line.name = name
+        line.note = note
+        line.quantity = qty
+        line.price = buy_price
+        line.sell_price = sell_price
+        line.total = total
+        line.flags |= LINE_FLAG_SELL_INITIALIZED
+
+        raw_good = texts[COL_GOOD_ID]
+        if raw_good:
+            try:
+                good_id = int(raw_good)
+            except ValueError:
+                if strict:
                     raise ImportValidationError(
-                        f"Строка {line.line_no}: Good ID '{good_id}' не найден в базе."
-                    )
-                if good is not None:
-                    line.matched_good_id = good_id
-                    if before_good_id != good_id:
-                        line.match_status = "manual"
-                        line.match_method = "manual"
-                        if line.action == "skip":
-                            line.action = "import"
-                    line.matched_tax_mode = good.tax_mode
-                    line.existing_sell_price = good.sell_price
-                else:
-                    line.matched_good_id = None
-                    line.existing_sell_price = None
+                        f"Строка {line.line_no}: некорректный Good ID '{raw_good}'."
+                    ) from None
+                good_id = -1
+            good = self.matcher.catalog.get(good_id)
+            if good is None and strict:
+                raise ImportValidationError(
+                    f"Строка {line.line_no}: Good ID '{good_id}' не найден в базе."
+                )
+            if good is not None:
+                line.matched_good_id = good_id
+                if before_good_id != good_id:
+                    line.match_status = "manual"
+                    line.match_method = "manual"
+                    if line.action == "skip":
+                        line.action = "import"
+                line.matched_tax_mode = good.tax_mode
+                line.existing_sell_price = good.sell_price
             else:
                 line.matched_good_id = None
                 line.existing_sell_price = None
+        else:
+            line.matched_good_id = None
+            line.existing_sell_price = None
 
-            target_code = normalize_article(self._item_text(row, COL_GOOD_CODE) or line.article)
-            target_name = normalize_text_field(
-                self._item_text(row, COL_GOOD_NAME) or line.name,
-                max_len=120,
+        target_code = normalize_article(texts[COL_GOOD_CODE] or line.article)
+        target_name = normalize_text_field(
+            texts[COL_GOOD_NAME] or line.name,
+            max_len=120,
+        )
+        line.matched_product_code = target_code
+        line.matched_name = target_name
+
+        # User can override sale price that will be written to DB
+        # via editable "Продажа в БД" column.
+        raw_sell_db = texts[COL_SELL_PRICE_OLD]
+        expected_db_sell = self._display_sell_price_in_db(line)
+        expected_db_text = (
+            _fmt_number(expected_db_sell, 2) if expected_db_sell is not None else ""
+        )
+        raw_sell_db_norm = raw_sell_db.translate(_FLOAT_TRANS)
+        expected_db_norm = expected_db_text.translate(_FLOAT_TRANS)
+        if raw_sell_db and raw_sell_db_norm != expected_db_norm:
+            db_sell_default = (
+                line.existing_sell_price
+                if line.existing_sell_price is not None
+                else (line.sell_price if line.sell_price is not None else line.price)
             )
-            line.matched_product_code = target_code
-            line.matched_name = target_name
-
-            # User can override sale price that will be written to DB
-            # via editable "Продажа в БД" column.
-            raw_sell_db = self._item_text(row, COL_SELL_PRICE_OLD).strip()
-            expected_db_sell = self._display_sell_price_in_db(line)
-            expected_db_text = (
-                _fmt_number(expected_db_sell, 2) if expected_db_sell is not None else ""
+            user_sell_db = self._parse_float_input(
+                raw_sell_db,
+                line_no=line.line_no,
+                field_name="продажа в БД",
+                strict=strict,
+                default=db_sell_default,
             )
-            raw_sell_db_norm = raw_sell_db.replace(" ", "").replace(",", ".")
-            expected_db_norm = expected_db_text.replace(" ", "").replace(",", ".")
-            if raw_sell_db and raw_sell_db_norm != expected_db_norm:
-                db_sell_default = (
-                    line.existing_sell_price
-                    if line.existing_sell_price is not None
-                    else (line.sell_price if line.sell_price is not None else line.price)
-                )
-                user_sell_db = self._parse_float_input(
-                    raw_sell_db,
-                    line_no=line.line_no,
-                    field_name="продажа в БД",
-                    strict=strict,
-                    default=db_sell_default,
-                )
-                line.sell_price = user_sell_db
-                line.raw_data["_sell_initialized"] = True
-                if line.matched_good_id is not None:
-                    if (
-                        line.existing_sell_price is None
-                        or abs(user_sell_db - line.existing_sell_price) > 0.0001
-                    ):
-                        line.raw_data["_force_update_sell_price"] = True
-                        line.raw_data["_price_applied"] = True
-                    else:
-                        line.raw_data.pop("_force_update_sell_price", None)
-                        line.raw_data.pop("_price_applied", None)
-
-            self._refresh_line_price_state(line)
+            line.sell_price = user_sell_db
+            line.flags |= LINE_FLAG_SELL_INITIALIZED
+            if line.matched_good_id is not None:
+                if (
+                    line.existing_sell_price is None
+                    or abs(user_sell_db - line.existing_sell_price) > 0.0001
+                ):
+                    line.flags |= LINE_FLAG_FORCE_UPDATE_SELL_PRICE
+                    line.flags |= LINE_FLAG_PRICE_APPLIED
+                else:
+                    line.flags &= ~LINE_FLAG_FORCE_UPDATE_SELL_PRICE
+                    line.flags &= ~LINE_FLAG_PRICE_APPLIED
+
+        self._refresh_line_price_state(line)
+
+    # Колонки, которые _sync_line_from_row читает из таблицы.
+    _SYNC_COLUMNS = (
+        COL_ACTION,
+        COL_ARTICLE,
+        COL_NAME,
+        COL_NOTE,
+        COL_QTY,
+        COL_BUY_PRICE,
+        COL_SELL_PRICE,
+        COL_SUM,
+        COL_GOOD_ID,
+        COL_GOOD_CODE,
+        COL_GOOD_NAME,
+        COL_SELL_PRICE_OLD,
+    )
+
+    def _row_texts(self, row: int) -> list[str]:
+        # Тексты нужных ячеек строки за один проход; то же, что _item_text по каждой колонке.
+        item_at = self.table.item
+        texts = [""] * self.table.columnCount()
+        for col in self._SYNC_COLUMNS:
+            item = item_at(row, col)
+            if item is not None:
+                texts[col] = item.text().strip()
+        return texts
 
     def _on_action_changed(self, row: int, action: str) -> None:
         if self.current_invoice is None:
             return
         if 0 <= row < len(self.current_invoice.lines):
-            combo = self.table.cellWidget(row, COL_ACTION)
-            if isinstance(combo, QComboBox):
-                self._apply_action_combo_visual(combo, action)
             line = self.current_invoice.lines[row]
             changed = line.action != action
             if line.action != action:
-                line.raw_data["_manual_edited"] = True
+                line.flags |= LINE_FLAG_MANUAL_EDITED
             line.action = action
+            # Действие не входит ни в итоги, ни в счётчики внизу, пересчитывать их не нужно.
             if changed:
-                self._record_history_state()
-            self._apply_table_filter()
+                self._schedule_history_record()
 
     def _selected_rows(self) -> list[int]:
         if self.current_invoice is None:
@@ -4069,7 +4530,7 @@ class MainWindow(QMainWindow):
             line = self.current_invoice.lines[row]
             if line.action != action:
                 line.action = action
-                line.raw_data["_manual_edited"] = True
+                line.flags |= LINE_FLAG_MANUAL_EDITED
                 changed += 1
         if changed > 0:
             self._populate_table(self.current_invoice.lines)
@@ -4148,13 +4609,6 @@ class MainWindow(QMainWindow):
                     return True
         return super().eventFilter(watched, event)
 
-    def _apply_action_combo_visual(self, combo: QComboBox, action: str) -> None:
-        state = action if action in {"import", "create", "skip"} else "import"
-        combo.setProperty("actionKind", state)
-        combo.style().unpolish(combo)
-        combo.style().polish(combo)
-        combo.update()
-
     def _on_table_item_changed(self, item: QTableWidgetItem) -> None:
         if self._table_locked:
             return
@@ -4163,18 +4617,24 @@ class MainWindow(QMainWindow):
         row = item.row()
         if row < 0 or row >= len(self.current_invoice.lines):
             return
+        if item.column() == COL_ACTION:
+            action = item.text().strip()
+            if action in LINE_ACTIONS:
+                self._on_action_changed(row, action)
+            return
         line = self.current_invoice.lines[row]
-        line.raw_data["_manual_edited"] = True
+        line.flags |= LINE_FLAG_MANUAL_EDITED
+        # Правка ячейки меняет только свою строку: синхронизируем и перерисовываем её одну.
         if item.column() != COL_GOOD_ID:
             try:
-                self._sync_lines_from_table(strict=False)
-                self._populate_table(self.current_invoice.lines)
-                self._record_history_state()
+                self._sync_line_from_row(row, line, strict=False)
+                self._repopulate_rows([row])
+                self._schedule_history_record()
             except Exception as exc:
                 self._log(f"Предупреждение: не удалось синхронизировать строку после ручного изменения: {exc}")
             return
         try:
-            self._sync_lines_from_table(strict=False)
+            self._sync_line_from_row(row, line, strict=False)
         except Exception as exc:
             self._log(f"Предупреждение: не удалось синхронизировать строку после ручного ввода Good ID: {exc}")
         raw = item.text().strip()
@@ -4186,8 +4646,8 @@ class MainWindow(QMainWindow):
             line.match_status = "not_found"
             line.warning = "Good ID очищен вручную."
             self._refresh_line_price_state(line)
-            self._populate_table(self.current_invoice.lines)
-            self._record_history_state()
+            self._repopulate_rows([row])
+            self._schedule_history_record()
             return
         try:
             good_id = int(raw)
@@ -4195,33 +4655,34 @@ class MainWindow(QMainWindow):
             if line.action == "skip":
                 line.action = "import"
             self._refresh_line_price_state(line)
-            self._populate_table(self.current_invoice.lines)
-            self._record_history_state()
+            self._repopulate_rows([row])
+            self._schedule_history_record()
         except Exception as exc:
             self._error("Ошибка ручного ввода Good ID", exc=exc)
-            self._populate_table(self.current_invoice.lines)
+            self._repopulate_rows([row])
 
     def _select_supplier_by_hint(self, hint: str) -> None:
         target = _normalize_supplier_name(hint)
         if not target:
             return
 
-        best_index = -1
-        best_score = 0
-        best_len_delta = 10_000
-
-        for idx in range(self.supplier_combo.count()):
-            raw_text = self.supplier_combo.itemText(idx)
-            supplier_name = _extract_supplier_name(raw_text)
-            normalized_name = _normalize_supplier_name(supplier_name)
-            score = _supplier_match_score(normalized_name, target)
-            if score <= 0:
-                continue
-            len_delta = abs(len(normalized_name) - len(target))
-            if score > best_score or (score == best_score and len_delta < best_len_delta):
-                best_index = idx
-                best_score = score
-                best_len_delta = len_delta
+        best_index = self._supplier_exact_index.get(target, -1)
+        if best_index < 0:
+            # Частичные совпадения (префикс, подстрока) по индексу токенов не найти,
+            # поэтому без точного совпадения перебираем всех поставщиков.
+            target_tokens = frozenset(target.split())
+            target_len = len(target)
+            best_score = 0
+            best_len_delta = 10_000
+            for idx, (normalized_name, tokens, name_len) in enumerate(self._supplier_hint_names):
+                score = _supplier_match_score(normalized_name, target, tokens, target_tokens)
+                if score <= 0:
+                    continue
+                len_delta = abs(name_len - target_len)
+                if score > best_score or (score == best_score and len_delta < best_len_delta):
+                    best_index = idx
+                    best_score = score
+                    best_len_delta = len_delta
 
         if best_index < 0:
             if hasattr(self, "supplier_detect_label"):
@@ -4235,63 +4696,95 @@ class MainWindow(QMainWindow):
                 f"Автоопределение поставщика: {supplier_name}"
             )
 
-    def _refresh_line_price_state(self, line: InvoiceLine) -> None:
+    def _refresh_line_price_state(self, line: InvoiceLine, *, suggested: float | None = None) -> None:
+        if suggested is None:
+            suggested = calculate_suggested_sell_price(
+                line.price,
+                markup_percent=self.app_settings.markup_percent,
+                round_step=self.app_settings.round_step,
+            )
+        if not self._update_line_sell_state(line, suggested):
+            return
+        existing_sell = line.existing_sell_price
+        assert existing_sell is not None
+        if existing_sell <= 0:
+            diff_pct = 100.0 if (line.sell_price or 0.0) > 0 else 0.0
+        else:
+            diff_pct = abs((line.sell_price or 0.0) - existing_sell) / existing_sell * 100.0
+        line.sell_price_diff_percent = diff_pct
+        line.price_alert = diff_pct >= self.app_settings.price_alert_threshold_percent
+
+    def _refresh_all_line_price_states(self, lines: list[InvoiceLine]) -> None:
+        # Массовый вариант _refresh_line_price_state: флаги строк обновляются в цикле,
+        # а рекомендованная цена и отклонение от цены в БД считаются векторно.
+        settings = self.app_settings
+        suggested_prices = suggested_sell_prices(
+            [x.price for x in lines],
+            markup_percent=settings.markup_percent,
+            round_step=settings.round_step,
+        ).tolist()
+        pending = [
+            line
+            for line, suggested in zip(lines, suggested_prices)
+            if self._update_line_sell_state(line, suggested)
+        ]
+        if not pending:
+            return
+        diffs = sell_price_diff_percents(
+            [x.existing_sell_price for x in pending],
+            [x.sell_price or 0.0 for x in pending],
+        )
+        alerts = diffs >= settings.price_alert_threshold_percent
+        for line, diff_pct, alert in zip(pending, diffs.tolist(), alerts.tolist()):
+            line.sell_price_diff_percent = diff_pct
+            line.price_alert = alert
+
+    def _update_line_sell_state(self, line: InvoiceLine, suggested: float) -> bool:
+        """Обновляет цены и флаги строки; True — осталось посчитать отклонение от цены в БД."""
         existing_sell: float | None = line.existing_sell_price
         if self.matcher is not None and line.matched_good_id is not None:
             good = self.matcher.catalog.get(line.matched_good_id)
             if good is not None:
                 existing_sell = float(good.sell_price or 0.0)
         line.existing_sell_price = existing_sell
-
-        suggested = calculate_suggested_sell_price(
-            line.price,
-            markup_percent=self.app_settings.markup_percent,
-            round_step=self.app_settings.round_step,
-        )
         line.suggested_sell_price = suggested
 
-        if not line.raw_data.get("_sell_initialized", False):
+        if not line.flags & LINE_FLAG_SELL_INITIALIZED:
             if line.sell_price is None:
                 line.sell_price = suggested
             elif existing_sell is not None and abs(line.sell_price - existing_sell) <= 0.0001:
                 line.sell_price = suggested
             elif existing_sell is None and abs(line.sell_price - line.price) <= 0.0001:
                 line.sell_price = suggested
-            line.raw_data["_sell_initialized"] = True
+            line.flags |= LINE_FLAG_SELL_INITIALIZED
 
         # If user returned sale price to current DB value, cancel forced DB-sale update.
-        if line.raw_data.get("_force_update_sell_price", False):
+        if line.flags & LINE_FLAG_FORCE_UPDATE_SELL_PRICE:
             if existing_sell is None or line.sell_price is None:
-                line.raw_data.pop("_force_update_sell_price", None)
+                line.flags &= ~LINE_FLAG_FORCE_UPDATE_SELL_PRICE
             elif abs(line.sell_price - existing_sell) <= 0.0001:
-                line.raw_data.pop("_force_update_sell_price", None)
+                line.flags &= ~LINE_FLAG_FORCE_UPDATE_SELL_PRICE
 
-        if line.raw_data.get("_price_applied", False):
+        if line.flags & LINE_FLAG_PRICE_APPLIED:
             if existing_sell is None or line.sell_price is None:
-                line.raw_data.pop("_price_applied", None)
+                line.flags &= ~LINE_FLAG_PRICE_APPLIED
             elif abs(line.sell_price - existing_sell) <= 0.0001:
-                line.raw_data.pop("_price_applied", None)
+                line.flags &= ~LINE_FLAG_PRICE_APPLIED
 
         if existing_sell is None:
             line.sell_price_diff_percent = None
             line.price_alert = False
-            return
+            return False
 
         # When sale price is accepted for DB update, red alert is no longer needed.
         will_update_sell = self.app_settings.update_existing_sell_price or bool(
-            line.raw_data.get("_force_update_sell_price", False)
+            line.flags & LINE_FLAG_FORCE_UPDATE_SELL_PRICE
         )
         if will_update_sell:
             line.sell_price_diff_percent = 0.0
             line.price_alert = False
-            return
-
-        if existing_sell <= 0:
-            diff_pct = 100.0 if (line.sell_price or 0.0) > 0 else 0.0
-        else:
-            diff_pct = abs((line.sell_price or 0.0) - existing_sell) / existing_sell * 100.0
-        line.sell_price_diff_percent = diff_pct
-        line.price_alert = diff_pct >= self.app_settings.price_alert_threshold_percent
+            return False
+        return True
 
     def _display_sell_price_in_db(self, line: InvoiceLine) -> float | None:
         existing_sell = line.existing_sell_price
@@ -4300,7 +4793,7 @@ class MainWindow(QMainWindow):
         if line.sell_price is None:
             return existing_sell
         will_update_sell = self.app_settings.update_existing_sell_price or bool(
-            line.raw_data.get("_force_update_sell_price", False)
+            line.flags & LINE_FLAG_FORCE_UPDATE_SELL_PRICE
         )
         if will_update_sell:
             return float(line.sell_price)
@@ -4329,37 +4822,27 @@ class MainWindow(QMainWindow):
             )
         return " | ".join(parts)
 
-    def _status_text(self, status: str) -> str:
-        return {
-            "exact": "Найден",
-            "manual": "Выбран вручную",
-            "fuzzy": "По названию",
-            "hint": "Похожий (1 вариант)",
-            "ambiguous": "Несколько совпадений",
-            "not_found": "Не найден",
-        }.get(status, status or "")
-
-    def _status_color(self, status: str) -> QColor | None:
-        if status in {"exact", "manual"}:
-            return QColor("#E7F6EE")
-        if status == "fuzzy":
-            return QColor("#E9EFFC")
-        if status in {"hint", "ambiguous"}:
-            return QColor("#FDF4E2")
-        if status == "not_found":
-            return QColor("#FCECEC")
-        return None
+    @staticmethod
+    def _status_text(status: str) -> str:
+        return _status_text_ru(status)
+
+    @staticmethod
+    def _status_color(status: str) -> QColor | None:
+        return _STATUS_COLOR.get(status)
 
     def _summary_metrics(
         self,
         lines: list[InvoiceLine],
     ) -> tuple[int, int, int, int, int]:
-        found = sum(1 for x in lines if x.match_status in {"exact", "manual", "fuzzy"})
-        total = len(lines)
-        ambiguous = sum(1 for x in lines if x.match_status == "ambiguous")
-        missing = sum(1 for x in lines if x.match_status == "not_found")
-        warning_count = sum(1 for x in lines if bool(x.warning.strip()) or x.price_alert)
-        return found, total, ambiguous, missing, warning_count
+        # Один проход по строкам вместо отдельного обхода на каждый счётчик.
+        statuses: Counter[str] = Counter()
+        warning_count = 0
+        for x in lines:
+            statuses[x.match_status] += 1
+            if x.price_alert or x.warning.strip():
+                warning_count += 1
+        found = statuses["exact"] + statuses["manual"] + statuses["fuzzy"]
+        return found, len(lines), statuses["ambiguous"], statuses["not_found"], warning_count
 
     def _build_summary(self, lines: list[InvoiceLine]) -> str:
         found, total, ambiguous, missing, warning_count = self._summary_metrics(lines)
@@ -4378,15 +4861,10 @@ class MainWindow(QMainWindow):
         self.footer_missing_label.setText(f"Не найдено: {missing}")
         self.footer_warning_label.setText(f"Предупреждения: {warning_count}")
 
-    def _build_invoice_totals(self, lines: list[InvoiceLine]) -> str:
-        total_qty = sum(max(float(x.quantity), 0.0) for x in lines)
-        total_sum = sum(
-            (x.total if x.total > 0 else x.quantity * x.price)
-            for x in lines
-        )
+    def _build_invoice_totals(self, arrays: InvoiceArrays) -> str:
         return (
-            f"Кол-во: {_fmt_number(total_qty, 3)} | "
-            f"Сумма: {_fmt_number(total_sum, 2)}"
+            f"Кол-во: {_fmt_number(arrays.total_qty(), 3)} | "
+            f"Сумма: {_fmt_number(arrays.total_sum(), 2)}"
         )
 
     def _selected_data(self, combo: QComboBox, default: int) -> int:
@@ -4410,7 +4888,7 @@ class MainWindow(QMainWindow):
         strict: bool,
         default: float,
     ) -> float:
-        text = value.strip().replace(" ", "").replace(",", ".")
+        text = value.strip().translate(_FLOAT_TRANS)
         if not text:
             return default
         try:
@@ -4428,27 +4906,77 @@ class MainWindow(QMainWindow):
     def _apply_table_filter(self) -> None:
         if self.current_invoice is None:
             return
-        for row in range(len(self.current_invoice.lines)):
+        lines = self.current_invoice.lines
+        for row in range(len(lines)):
             self.table.setRowHidden(row, False)
-        self.invoice_totals_label.setText(self._build_invoice_totals(self.current_invoice.lines))
-        self._update_footer_metrics(self.current_invoice.lines)
+        self._refresh_invoice_totals()
+
+    def _refresh_invoice_totals(self) -> None:
+        if self.current_invoice is None:
+            return
+        lines = self.current_invoice.lines
+        arrays = self._invoice_arrays
+        if arrays is None or len(arrays) != len(lines):
+            arrays = self._invoice_arrays = InvoiceArrays.from_lines(lines)
+        self.invoice_totals_label.setText(self._build_invoice_totals(arrays))
+        self._update_footer_metrics(lines)
 
     def _log(self, text: str) -> None:
         message = str(text)
         get_logger().info(message)
-        self.log_box.appendPlainText(f"[{datetime.now().strftime('%H:%M:%S')}] {message}")
+        self._append_log_text(f"[{self._log_timestamp()}] {message}")
+
+    def _append_log_text(self, text: str, exc: BaseException | None = None) -> None:
+        if self.debug_log_enabled:
+            self.log_box.appendPlainText(_log_entry_text(text, exc))
+        else:
+            self._pending_log_lines.append((text, exc))
+
+    def _flush_pending_log(self) -> None:
+        if not self._pending_log_lines:
+            return
+        # Traceback форматируем только сейчас, когда журнал открыт. Очередь считает
+        # сообщения, а лимит окна — строки (блоки), поэтому лишние строки отрезаем здесь.
+        lines: list[str] = []
+        for text, exc in self._pending_log_lines:
+            lines.extend(_log_entry_text(text, exc).split("\n"))
+        self._pending_log_lines.clear()
+        self.log_box.appendPlainText("\n".join(lines[-self._LOG_MAX_BLOCKS:]))
+
+    def _log_timestamp(self) -> str:
+        sec = int(time.time())
+        if sec != self._log_stamp_sec:
+            self._log_stamp = time.strftime("%H:%M:%S", time.localtime(sec))
+            self._log_stamp_sec = sec
+        return self._log_stamp
 
     def _error(self, text: str, exc: Exception | None = None) -> None:
         message = f"ERROR: {text}"
         if exc is not None:
-            tb = traceback.format_exception(type(exc), exc, exc.__traceback__)
-            message = f"{message}: {exc}\n{''.join(tb).rstrip()}"
+            message = f"{message}: {exc}"
         get_logger().error(text, exc_info=exc)
-        self.log_box.appendPlainText(f"[{datetime.now().strftime('%H:%M:%S')}] {message}")
+        # Traceback в окне журнала форматируется, только когда журнал открыт (режим LOG):
+        # сразу или при открытии, если ошибка случилась, пока он был скрыт.
+        self._append_log_text(f"[{self._log_timestamp()}] {message}", exc)
         QMessageBox.critical(self, "Ошибка", text)
 
 
+def _log_entry_text(text: str, exc: BaseException | None) -> str:
+    if exc is None:
+        return text
+    tb = traceback.format_exception(type(exc), exc, exc.__traceback__)
+    return f"{text}\n{''.join(tb).rstrip()}"
+
+
 def _fmt_number(value: float, digits: int) -> str:
+    # Цены и количества в накладной часто повторяются, поэтому текст кэшируется.
+    # Ноль форматируем мимо кэша: 0.0 и -0.0 для него один ключ, а текст разный.
+    if value == 0:
+        return _fmt_number_uncached(value, digits)
+    return _fmt_number_cached(value, digits)
+
+
+def _fmt_number_uncached(value: float, digits: int) -> str:
     fmt = f"{{:.{digits}f}}"
     out = fmt.format(value)
     if "." in out:
@@ -4456,6 +4984,77 @@ def _fmt_number(value: float, digits: int) -> str:
     return out
 
 
+_fmt_number_cached = lru_cache(maxsize=2048)(_fmt_number_uncached)
+
+
+_INVOICE_LINE_FIELDS = tuple(item.name for item in fields(InvoiceLine))
+
+# Ввод чисел в таблице: пробелы (в т.ч. неразрывные) убираем, запятую считаем точкой.
+_FLOAT_TRANS = str.maketrans({" ": "", "\u00a0": "", ",": "."})
+_WARNING_LINE_PREFIX_RE = re.compile(r"^\s*строка\s+\d+\s*:\s*", re.IGNORECASE)
+_WARNING_LINE_NO_RE = re.compile(r"строка\s+(\d+)", re.IGNORECASE)
+
+
+def _pickle_dumps(value: object) -> bytes:
+    # pickle-копия в несколько раз быстрее copy.deepcopy для строк накладной.
+    return pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+# Крупные диапазоны строк в истории (удаление/вставка многих строк) храним сжатыми.
+_HISTORY_COMPRESS_MIN_BYTES = 64 * 1024
+
+
+def _pack_history_blob(raw: bytes) -> bytes:
+    if len(raw) > _HISTORY_COMPRESS_MIN_BYTES:
+        return b"Z" + zlib.compress(raw, 1)
+    return b"R" + raw
+
+
+def _unpack_history_blob(blob: bytes) -> bytes:
+    if blob[:1] == b"Z":
+        return zlib.decompress(blob[1:])
+    return blob[1:]
+
+
+@lru_cache(maxsize=None)
+def _update_cache_dir_impl() -> Path:
+    # Переменные окружения не меняются за время работы процесса.
+    appdata = os.environ.get("LOCALAPPDATA") or os.environ.get("APPDATA")
+    if appdata:
+        return Path(appdata) / "Dazzle" / "updates"
+    return _home_dir() / "Dazzle" / "updates"
+
+
+@lru_cache(maxsize=None)
+def _home_dir() -> Path:
+    return Path.home()
+
+
+@lru_cache(maxsize=None)
+def _cwd_str() -> str:
+    # Рабочий каталог приложение не меняет (os.chdir не вызывается).
+    return str(Path.cwd())
+
+
+@lru_cache(maxsize=None)
+def _downloads_dir_str() -> str:
+    return str(_home_dir() / "Downloads")
+
+
+def _db_file_stamp(db_path: Path) -> tuple[int, int] | None:
+    # Изменения SQLite в режиме WAL сначала попадают в файл -wal,
+    # поэтому учитываем время изменения обоих файлов.
+    try:
+        db_mtime = os.stat(db_path).st_mtime_ns
+    except OSError:
+        return None
+    try:
+        wal_mtime = os.stat(f"{db_path}-wal").st_mtime_ns
+    except OSError:
+        wal_mtime = 0
+    return db_mtime, wal_mtime
+
+
 def _same_path(left: Path, right: Path) -> bool:
     try:
         return left.resolve(strict=False) == right.resolve(strict=False)
@@ -4464,26 +5063,85 @@ def _same_path(left: Path, right: Path) -> bool:
 
 
 def _fill_payment_combo(combo: QComboBox) -> None:
-    combo.clear()
+    _combo_clear(combo)
     for label, payment_type in PAYMENT_OPTIONS:
-        combo.addItem(label, userData=payment_type)
+        _combo_add_item(combo, payment_type, label, text=label)
+
+
+def _combo_clear(combo: QComboBox) -> None:
+    combo.clear()
+    combo._id_index = {}
+    combo._id_name_pairs = []
+
+
+def _combo_add_item(combo: QComboBox, item_id: int, name: str, *, text: str | None = None) -> None:
+    # Индекс id -> позиция ведём рядом с комбобоксом, чтобы выбор по id
+    # не перебирал itemData() каждого пункта.
+    if not hasattr(combo, "_id_index"):
+        combo._id_index = {}
+        combo._id_name_pairs = []
+    item_id = int(item_id)
+    combo.addItem(text if text is not None else f"{name} [{item_id}]", userData=item_id)
+    combo._id_index.setdefault(item_id, combo.count() - 1)
+    combo._id_name_pairs.append((item_id, str(name).strip() or f"ID {item_id}"))
+
+
+def _fill_id_combo(combo: QComboBox, items: list[tuple[int, str]]) -> None:
+    # Пересборка списка не должна вызывать обработчики смены выбора на каждом addItem.
+    with QSignalBlocker(combo):
+        combo.setUpdatesEnabled(False)
+        try:
+            _combo_clear(combo)
+            for item_id, name in items:
+                _combo_add_item(combo, item_id, name)
+        finally:
+            combo.setUpdatesEnabled(True)
+
+
+def _set_combo_by_id(combo: QComboBox, target: int) -> None:
+    try:
+        target_id = int(target)
+    except (TypeError, ValueError):
+        return
+    index = getattr(combo, "_id_index", None)
+    if index is not None:
+        idx = index.get(target_id)
+        if idx is not None:
+            combo.setCurrentIndex(idx)
+        return
+    for idx in range(combo.count()):
+        data = combo.itemData(idx)
+        if data is not None and int(data) == target_id:
+            combo.setCurrentIndex(idx)
+            return
+
 
+_SUPPLIER_SUFFIX_RE = re.compile(r"^(.*?)(?:\s*\[\d+\])?$")
+_SUPPLIER_CLEAN_RE = re.compile(r"[^0-9a-zа-я]+")
 
+
+@lru_cache(maxsize=4096)
 def _extract_supplier_name(combo_text: str) -> str:
     text = combo_text.strip()
-    match = re.match(r"^(.*?)(?:\s*\[\d+\])?$", text)
+    match = _SUPPLIER_SUFFIX_RE.match(text)
     if match:
         return match.group(1).strip()
     return text
 
 
+@lru_cache(maxsize=4096)
 def _normalize_supplier_name(value: str) -> str:
     text = value.strip().lower().replace("ё", "е")
-    text = re.sub(r"[^0-9a-zа-я]+", " ", text)
+    text = _SUPPLIER_CLEAN_RE.sub(" ", text)
     return " ".join(text.split())
 
 
-def _supplier_match_score(supplier_name: str, target: str) -> int:
+def _supplier_match_score(
+    supplier_name: str,
+    target: str,
+    supplier_tokens: frozenset[str] | None = None,
+    target_tokens: frozenset[str] | None = None,
+) -> int:
     if not supplier_name or not target:
         return 0
     if supplier_name == target:
@@ -4493,41 +5151,55 @@ def _supplier_match_score(supplier_name: str, target: str) -> int:
     if target in supplier_name:
         return 140
 
-    supplier_tokens = set(supplier_name.split())
-    target_tokens = set(target.split())
+    if supplier_tokens is None:
+        supplier_tokens = frozenset(supplier_name.split())
+    if target_tokens is None:
+        target_tokens = frozenset(target.split())
     if not supplier_tokens or not target_tokens:
         return 0
-    overlap = supplier_tokens & target_tokens
-    if not overlap:
-        return 0
-    if target_tokens.issubset(supplier_tokens):
+    if target_tokens <= supplier_tokens:
         return 110
+    if supplier_tokens.isdisjoint(target_tokens):
+        return 0
     return 70
 
 
+_STATUS_TEXT_RU = {
+    "exact": "Найден",
+    "manual": "Выбран вручную",
+    "fuzzy": "По названию",
+    "hint": "Похожий (1 вариант)",
+    "ambiguous": "Несколько совпадений",
+    "not_found": "Не найден",
+}
+
+
+# Цвета статусов создаются один раз, а не на каждую строку таблицы.
+_STATUS_COLOR = {
+    "exact": QColor("#E7F6EE"),
+    "manual": QColor("#E7F6EE"),
+    "fuzzy": QColor("#E9EFFC"),
+    "hint": QColor("#FDF4E2"),
+    "ambiguous": QColor("#FDF4E2"),
+    "not_found": QColor("#FCECEC"),
+}
+
+_STATUS_COLOR_DIALOG = {
+    "exact": QColor(214, 242, 214),
+    "manual": QColor(214, 242, 214),
+    "fuzzy": QColor(225, 238, 255),
+    "hint": QColor(255, 244, 205),
+    "ambiguous": QColor(255, 236, 186),
+    "not_found": QColor(255, 210, 210),
+}
+
+
 def _status_text_ru(status: str) -> str:
-    return {
-        "exact": "Найден",
-        "manual": "Выбран вручную",
-        "fuzzy": "По названию",
-        "hint": "Похожий (1 вариант)",
-        "ambiguous": "Несколько совпадений",
-        "not_found": "Не найден",
-    }.get(status, status or "")
+    return _STATUS_TEXT_RU.get(status, status or "")
 
 
 def _status_color_for_dialog(status: str) -> QColor | None:
-    if status in {"exact", "manual"}:
-        return QColor(214, 242, 214)
-    if status == "fuzzy":
-        return QColor(225, 238, 255)
-    if status == "hint":
-        return QColor(255, 244, 205)
-    if status == "ambiguous":
-        return QColor(255, 236, 186)
-    if status == "not_found":
-        return QColor(255, 210, 210)
-    return None
+    return _STATUS_COLOR_DIALOG.get(status)
 
 
 def _show_table_copy_menu(table: QTableWidget, pos, parent: QWidget) -> None:
@@ -4574,24 +5246,22 @@ def _copy_selected_cells(table: QTableWidget) -> None:
         _copy_current_cell(table)
         return
 
-    min_row = min(idx.row() for idx in indexes)
-    max_row = max(idx.row() for idx in indexes)
-    min_col = min(idx.column() for idx in indexes)
-    max_col = max(idx.column() for idx in indexes)
-    selected = {(idx.row(), idx.column()) for idx in indexes}
-
-    lines: list[str] = []
-    for row in range(min_row, max_row + 1):
-        vals: list[str] = []
-        for col in range(min_col, max_col + 1):
-            if (row, col) not in selected:
-                vals.append("")
-                continue
-            widget = table.cellWidget(row, col)
-            if isinstance(widget, QComboBox):
-                vals.append(widget.currentText())
-                continue
+    cells = [(idx.row(), idx.column()) for idx in indexes]
+    min_row = min(row for row, _col in cells)
+    max_row = max(row for row, _col in cells)
+    min_col = min(col for _row, col in cells)
+    max_col = max(col for _row, col in cells)
+
+    # Плотная сетка заполняется одним проходом по выделенным ячейкам;
+    # невыделенные ячейки прямоугольника остаются пустыми.
+    width = max_col - min_col + 1
+    grid = [[""] * width for _ in range(max_row - min_row + 1)]
+    for row, col in cells:
+        widget = table.cellWidget(row, col)
+        if isinstance(widget, QComboBox):
+            text = widget.currentText()
+        else:
             item = table.item(row, col)
-            vals.append(item.text() if item is not None else "")
-        lines.append("\t".join(vals))
-    QApplication.clipboard().setText("\n".join(lines))
+            text = item.text() if item is not None else ""
+        grid[row - min_row][col - min_col] = text
+    QApplication.clipboard().setText("\n".join("\t".join(vals) for vals in grid))
@@ -0,0 +1,80 @@
+"""Колоночное (SoA) представление числовых полей накладной.
+
+Итоги и массовые пересчёты цен считаются векторно по массивам NumPy,
+а не отдельными проходами Python по list[InvoiceLine].
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+
+import numpy as np
+
+from .models import InvoiceLine
+
+
+@dataclass
+class InvoiceArrays:
+    qty: np.ndarray
+    buy: np.ndarray
+    sell: np.ndarray  # NaN, если цена продажи не задана
+    sum: np.ndarray  # сумма строки: total, а если он не задан — qty * buy
+
+    @classmethod
+    def from_lines(cls, lines: list[InvoiceLine]) -> InvoiceArrays:
+        count = len(lines)
+        qty = np.fromiter((x.quantity for x in lines), dtype=np.float64, count=count)
+        buy = np.fromiter((x.price for x in lines), dtype=np.float64, count=count)
+        sell = np.fromiter(
+            (np.nan if x.sell_price is None else x.sell_price for x in lines),
+            dtype=np.float64,
+            count=count,
+        )
+        total = np.fromiter((x.total for x in lines), dtype=np.float64, count=count)
+        return cls(qty=qty, buy=buy, sell=sell, sum=np.where(total > 0, total, qty * buy))
+
+    def update_rows(self, lines: list[InvoiceLine], rows: list[int]) -> None:
+        """Обновляет значения только для строк rows (длина lines не должна меняться)."""
+        for row in rows:
+            if not 0 <= row < self.qty.size:
+                continue
+            x = lines[row]
+            self.qty[row] = x.quantity
+            self.buy[row] = x.price
+            self.sell[row] = np.nan if x.sell_price is None else x.sell_price
+            self.sum[row] = x.total if x.total > 0 else x.quantity * x.price
+
+    def __len__(self) -> int:
+        return int(self.qty.size)
+
+    def total_qty(self) -> float:
+        return float(np.clip(self.qty, 0.0, None).sum())
+
+    def total_sum(self) -> float:
+        return float(self.sum.sum())
+
+
+def suggested_sell_prices(
+    buy: np.ndarray | list[float],
+    *,
+    markup_percent: float = 50.0,
+    round_step: float = 50.0,
+) -> np.ndarray:
+    """Векторный аналог db.calculate_suggested_sell_price для массива закупочных цен."""
+    # fmax, а не maximum: NaN (пустая ячейка Excel) даёт 0, как max(0.0, nan) в скалярной версии.
+    marked = np.fmax(np.asarray(buy, dtype=np.float64), 0.0) * (1.0 + (markup_percent / 100.0))
+    if round_step <= 0:
+        return marked
+    return np.ceil(marked / round_step) * round_step
+
+
+def sell_price_diff_percents(
+    existing: np.ndarray | list[float],
+    sell: np.ndarray | list[float],
+) -> np.ndarray:
+    """Отклонение цены продажи от цены в БД в процентах (как в MainWindow._refresh_line_price_state)."""
+    existing_arr = np.asarray(existing, dtype=np.float64)
+    sell_arr = np.asarray(sell, dtype=np.float64)
+    positive = existing_arr > 0
+    safe_existing = np.where(positive, existing_arr, 1.0)
+    relative = np.abs(sell_arr - existing_arr) / safe_existing * 100.0
+    return np.where(positive, relative, np.where(sell_arr > 0, 100.0, 0.0))
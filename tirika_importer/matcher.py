@@ -1,18 +1,22 @@
 ﻿from __future__ import annotations
 
 import re
-from collections import defaultdict
-from dataclasses import dataclass
+from collections import OrderedDict, defaultdict
 from difflib import SequenceMatcher
+from functools import lru_cache
+import heapq
 
 from .db import GoodRecord
-from .models import InvoiceLine, MatchCandidate
+from .models import LINE_FLAG_SELL_INITIALIZED, InvoiceLine, MatchCandidate
 
-
-@dataclass
-class _IndexEntry:
-    good_id: int
-    source: str
+_CODE_ALNUM_RE = re.compile(r"[^0-9a-zа-я]+")
+# ASCII-байты, которые normalize_code_alnum выбрасывает (всё, кроме 0-9 и a-z).
+_CODE_ASCII_DELETE = bytes(b for b in range(256) if not (48 <= b <= 57 or 97 <= b <= 122))
+_NAME_NONWORD_RE = re.compile(r"[\W_]+", re.UNICODE)
+_SPACES_RE = re.compile(r"\s+")
+_ARTICLE_PREFIXES = ("xmil-", "xzk-", "xkl-", "xgsp-", "xtrw-", "xms-")
+# Сколько последних токенов запроса помнит GoodsMatcher._positions_with_token.
+_TOKEN_POSITIONS_CACHE_SIZE = 2048
 
 
 def normalize_code(value: str) -> str:
@@ -20,7 +24,14 @@ def normalize_code(value: str) -> str:
 
 
 def normalize_code_alnum(value: str) -> str:
-    return re.sub(r"[^0-9a-zа-я]+", "", value.strip().lower())
+    value = value.strip().lower()
+    if value.isascii():
+        # Большинство кодов — ASCII: чистим bytes.translate без regex,
+        # а уже чистые буквенно-цифровые коды возвращаем как есть.
+        if not value or value.isalnum():
+            return value
+        return value.encode("ascii").translate(None, _CODE_ASCII_DELETE).decode("ascii")
+    return _CODE_ALNUM_RE.sub("", value)
 
 
 def build_article_variants(article: str) -> list[str]:
@@ -30,12 +41,14 @@ def build_article_variants(article: str) -> list[str]:
 
     variants = [raw]
     lowered = raw.lower()
-    for prefix in ("xmil-", "xzk-", "xkl-", "xgsp-", "xtrw-", "xms-"):
+    for prefix in _ARTICLE_PREFIXES:
         if lowered.startswith(prefix):
             variants.append(raw[len(prefix) :])
+            break  # префиксы не пересекаются, подойти может только один
 
-    if "-" in raw:
-        right = raw.split("-", 1)[1]
+    dash = raw.find("-")
+    if dash >= 0:
+        right = raw[dash + 1 :]
         if right:
             variants.append(right)
         pieces = [p for p in raw.split("-") if p]
@@ -43,97 +56,174 @@ def build_article_variants(article: str) -> list[str]:
             variants.append("-".join(pieces[-2:]))
 
     variants.append(normalize_code_alnum(raw))
-    seen: set[str] = set()
-    out: list[str] = []
-    for item in variants:
-        key = item.strip()
-        if key and key not in seen:
-            seen.add(key)
-            out.append(key)
-    return out
+    # dict.fromkeys сохраняет порядок первого появления и убирает дубли.
+    return list(dict.fromkeys(key for key in map(str.strip, variants) if key))
+
+
+@lru_cache(maxsize=4096)
+def _article_code_keys(article: str, expand_variants: bool) -> tuple[tuple[str, str], ...]:
+    """Пары (normalize_code, normalize_code_alnum) для вариантов артикула.
+
+    Кэш общий для всех источников кода: штрихкод и кросс используют одни и те же
+    варианты, а одинаковые артикулы часто повторяются в строках накладной.
+    """
+    variants = build_article_variants(article) if expand_variants else [article]
+    return tuple((normalize_code(variant), normalize_code_alnum(variant)) for variant in variants)
 
 
 class GoodsMatcher:
     def __init__(self, catalog: dict[int, GoodRecord], article_match_field: str = "product_code") -> None:
         self.catalog = catalog
         self.article_match_field = _normalize_match_field(article_match_field)
-        self._product_exact_index: dict[str, list[_IndexEntry]] = defaultdict(list)
-        self._product_alnum_index: dict[str, list[_IndexEntry]] = defaultdict(list)
-        self._cross_exact_index: dict[str, list[_IndexEntry]] = defaultdict(list)
-        self._cross_alnum_index: dict[str, list[_IndexEntry]] = defaultdict(list)
-        self._barcode_exact_index: dict[str, list[_IndexEntry]] = defaultdict(list)
-        self._barcode_alnum_index: dict[str, list[_IndexEntry]] = defaultdict(list)
-        self._norm_names: dict[int, str] = {}
-        self._build_indexes()
-
-    def _build_indexes(self) -> None:
+        # Индексы строятся лениво, при первом обращении: кодовые — при первом
+        # сопоставлении, по названию — при первом фолбэке, строки поиска — при
+        # первом search_goods. Каждый индекс собирается в локальные переменные и
+        # публикуется одним присваиванием, поэтому недостроенный индекс не виден.
+        #
+        # Индексы кодов: источник -> (exact, alnum), ключ -> good_id в порядке каталога.
+        self._code_indexes: dict[str, tuple[dict[str, list[int]], dict[str, list[int]]]] | None = None
+        # Для поиска по названию: товары с непустым названием в порядке каталога
+        # и индекс «слово названия -> позиции в этом списке».
+        self._name_index: tuple[list[tuple[GoodRecord, str]], dict[str, set[int]]] | None = None
+        # Токен запроса -> позиции в списке названий; ограничен по размеру (LRU),
+        # чтобы не расти за сеанс на больших каталогах.
+        self._token_positions_cache: OrderedDict[str, frozenset[int]] = OrderedDict()
+        # Для search_goods: нормализованные коды и название каждого товара считаются
+        # один раз, а не на каждое нажатие клавиши в диалоге поиска.
+        self._search_rows: list[
+            tuple[GoodRecord, str, str, tuple[tuple[str, str], ...], tuple[tuple[str, str], ...], str]
+        ] | None = None
+
+    def _ensure_code_indexes(self) -> dict[str, tuple[dict[str, list[int]], dict[str, list[int]]]]:
+        indexes = self._code_indexes
+        if indexes is not None:
+            return indexes
+        product_exact: dict[str, list[int]] = defaultdict(list)
+        product_alnum: dict[str, list[int]] = defaultdict(list)
+        cross_exact: dict[str, list[int]] = defaultdict(list)
+        cross_alnum: dict[str, list[int]] = defaultdict(list)
+        barcode_exact: dict[str, list[int]] = defaultdict(list)
+        barcode_alnum: dict[str, list[int]] = defaultdict(list)
         for good in self.catalog.values():
             if good.product_code:
                 exact = normalize_code(good.product_code)
                 alnum = normalize_code_alnum(good.product_code)
                 if exact:
-                    self._product_exact_index[exact].append(_IndexEntry(good.good_id, "product_code"))
+                    product_exact[exact].append(good.good_id)
                 if alnum:
-                    self._product_alnum_index[alnum].append(_IndexEntry(good.good_id, "product_code"))
+                    product_alnum[alnum].append(good.good_id)
 
             for cross in good.cross_codes:
                 exact = normalize_code(cross)
                 alnum = normalize_code_alnum(cross)
                 if exact:
-                    self._cross_exact_index[exact].append(_IndexEntry(good.good_id, "cross_code"))
+                    cross_exact[exact].append(good.good_id)
                 if alnum:
-                    self._cross_alnum_index[alnum].append(_IndexEntry(good.good_id, "cross_code"))
+                    cross_alnum[alnum].append(good.good_id)
 
             for barcode in good.barcodes:
                 exact = normalize_code(barcode)
                 alnum = normalize_code_alnum(barcode)
                 if exact:
-                    self._barcode_exact_index[exact].append(_IndexEntry(good.good_id, "barcode"))
+                    barcode_exact[exact].append(good.good_id)
                 if alnum:
-                    self._barcode_alnum_index[alnum].append(_IndexEntry(good.good_id, "barcode"))
-
-            self._norm_names[good.good_id] = normalize_name(good.name)
+                    barcode_alnum[alnum].append(good.good_id)
+
+        indexes = {
+            "product_code": (product_exact, product_alnum),
+            "cross_code": (cross_exact, cross_alnum),
+            "barcode": (barcode_exact, barcode_alnum),
+        }
+        self._code_indexes = indexes
+        return indexes
+
+    def _ensure_name_index(self) -> tuple[list[tuple[GoodRecord, str]], dict[str, set[int]]]:
+        index = self._name_index
+        if index is not None:
+            return index
+        name_goods: list[tuple[GoodRecord, str]] = []
+        word_index: dict[str, set[int]] = defaultdict(set)
+        for good in self.catalog.values():
+            norm_name = normalize_name(good.name)
+            if norm_name:
+                pos = len(name_goods)
+                name_goods.append((good, norm_name))
+                for word in norm_name.split():
+                    word_index[word].add(pos)
+        index = (name_goods, word_index)
+        self._token_positions_cache.clear()  # позиции относятся к прежнему индексу
+        self._name_index = index
+        return index
+
+    def _ensure_search_rows(
+        self,
+    ) -> list[tuple[GoodRecord, str, str, tuple[tuple[str, str], ...], tuple[tuple[str, str], ...], str]]:
+        rows = self._search_rows
+        if rows is not None:
+            return rows
+        rows = [
+            (
+                good,
+                good.product_code.lower(),
+                normalize_code_alnum(good.product_code),
+                tuple((code.lower(), normalize_code_alnum(code)) for code in good.cross_codes),
+                tuple((code.lower(), normalize_code_alnum(code)) for code in good.barcodes),
+                normalize_name(good.name),
+            )
+            for good in self.catalog.values()
+        ]
+        self._search_rows = rows
+        return rows
 
     def match_lines(self, lines: list[InvoiceLine]) -> None:
+        # Одинаковые артикулы и названия в накладной ищем один раз: поиск зависит
+        # только от них и каталога, а кандидаты после сопоставления не меняются.
+        code_lookups: dict[str, list[MatchCandidate]] = {}
+        name_lookups: dict[str, list[MatchCandidate]] = {}
         for line in lines:
-            self.match_line(line)
+            self._match_line(line, code_lookups, name_lookups)
             self._apply_forced_skip_markers(line)
 
     def match_line(self, line: InvoiceLine) -> None:
-        line.raw_data.pop("_sell_initialized", None)
+        self._match_line(line, {}, {})
+
+    def _match_line(
+        self,
+        line: InvoiceLine,
+        code_lookups: dict[str, list[MatchCandidate]],
+        name_lookups: dict[str, list[MatchCandidate]],
+    ) -> None:
+        line.flags &= ~LINE_FLAG_SELL_INITIALIZED
         article = line.article.strip()
         name = line.name.strip()
 
         # 1) Точное совпадение по выбранному главному полю.
         # Если код принадлежит одному товару, это надежное автосопоставление.
-        code_candidates = self._find_exact_code_candidates(article)
+        code_candidates = code_lookups.get(article)
+        if code_candidates is None:
+            code_candidates = code_lookups[article] = self._find_exact_code_candidates(article)
         if code_candidates:
-            line.candidates = code_candidates
+            line.candidates = list(code_candidates)
             line.similar_articles = _format_similar_articles(code_candidates)
             if len(code_candidates) == 1:
                 self._apply_candidate(line, code_candidates[0], status="exact")
                 line.action = "import"
                 line.warning = ""
             else:
-                line.match_status = "ambiguous"
-                line.match_method = "exact_code_ambiguous"
-                line.warning = "Несколько товаров с таким кодом, выберите вручную."
-                line.matched_good_id = None
-                line.matched_name = line.name
-                line.matched_product_code = line.article
-                line.matched_buy_price = None
-                line.existing_sell_price = None
-                line.sell_price = line.price
-                line.suggested_sell_price = None
-                line.sell_price_diff_percent = None
-                line.price_alert = False
-                line.matched_tax_mode = 0
-                line.action = "skip"
+                _reset_unmatched(
+                    line,
+                    status="ambiguous",
+                    method="exact_code_ambiguous",
+                    action="skip",
+                    warning="Несколько товаров с таким кодом, выберите вручную.",
+                )
             return
 
         # 2) Фолбэк по названию.
-        name_candidates = self._find_by_name(name, limit=8)
-        line.candidates = name_candidates
+        name_candidates = name_lookups.get(name)
+        if name_candidates is None:
+            name_candidates = name_lookups[name] = self._find_by_name(name, limit=8)
+        line.candidates = list(name_candidates)
         line.similar_articles = _format_similar_articles(name_candidates)
         if len(name_candidates) == 1 and name_candidates[0].score >= 0.85:
             self._apply_candidate(line, name_candidates[0], status="fuzzy")
@@ -141,20 +231,13 @@ class GoodsMatcher:
             line.warning = "Автосопоставление по названию. Проверьте перед импортом."
             return
 
-        line.match_status = "not_found"
-        line.match_method = ""
-        line.matched_good_id = None
-        line.matched_name = line.name
-        line.matched_product_code = line.article
-        line.matched_buy_price = None
-        line.existing_sell_price = None
-        line.sell_price = line.price
-        line.suggested_sell_price = None
-        line.sell_price_diff_percent = None
-        line.price_alert = False
-        line.matched_tax_mode = 0
-        line.action = "create"
-        line.warning = "Товар не найден автоматически."
+        _reset_unmatched(
+            line,
+            status="not_found",
+            method="",
+            action="create",
+            warning="Товар не найден автоматически.",
+        )
 
     @staticmethod
     def _apply_forced_skip_markers(line: InvoiceLine) -> None:
@@ -183,29 +266,51 @@ class GoodsMatcher:
         q_norm_name = normalize_name(query)
         q_alnum = normalize_code_alnum(query)
         prefer_code_only = _looks_like_article_query(q_raw)
-        for good in self.catalog.values():
+        name_window = len(q_norm_name) * 2
+        fuzzy_ratios: dict[str, float] = {}  # у многих товаров одинаковое начало названия
+        # Символы окна, которых нет в запросе, совпасть не могут: после их удаления
+        # (одним regex-вызовом на C) длина остатка ограничивает ratio сверху.
+        q_name_len = len(q_norm_name)
+        foreign_chars_re = (
+            re.compile("[^" + "".join(re.escape(ch) for ch in set(q_norm_name)) + "]+")
+            if q_norm_name
+            else None
+        )
+        for good, code, code_alnum, cross_keys, barcode_keys, name_norm in self._ensure_search_rows():
             score = 0.0
             method = "search"
 
-            code = good.product_code.lower()
             if q in code:
                 score = 1.0
                 method = "search_code"
-            elif q_alnum and q_alnum in normalize_code_alnum(good.product_code):
+            elif q_alnum and q_alnum in code_alnum:
                 score = 0.95
                 method = "search_code_alnum"
             else:
-                sec_score, sec_method = self._search_secondary_codes(good, q, q_alnum)
+                sec_score, sec_method = _search_secondary_codes(cross_keys, barcode_keys, q, q_alnum)
                 if sec_score > 0:
                     score = sec_score
                     method = sec_method
                 elif not prefer_code_only:
-                    name_norm = self._norm_names.get(good.good_id, "")
                     if q_norm_name and q_norm_name in name_norm:
                         score = 0.9
                         method = "search_name"
                     else:
-                        ratio = SequenceMatcher(None, q_norm_name, name_norm[: len(q_norm_name) * 2]).ratio()
+                        window = name_norm[:name_window]
+                        ratio = fuzzy_ratios.get(window)
+                        if ratio is None:
+                            # ratio() не больше real_quick_ratio()/quick_ratio(): дешёвые
+                            # верхние оценки отсекают заведомо непохожие названия.
+                            ratio = 0.0
+                            if foreign_chars_re is None or (
+                                2.0 * min(len(foreign_chars_re.sub("", window)), q_name_len)
+                                / (q_name_len + len(window))
+                                >= 0.35
+                            ):
+                                sm = SequenceMatcher(None, q_norm_name, window)
+                                if sm.real_quick_ratio() >= 0.35 and sm.quick_ratio() >= 0.35:
+                                    ratio = sm.ratio()
+                            fuzzy_ratios[window] = ratio
                         if ratio >= 0.35:
                             score = ratio
                             method = "search_fuzzy"
@@ -216,50 +321,11 @@ class GoodsMatcher:
         items.sort(key=lambda x: x[0], reverse=True)
         return [cand for _, cand in items[:limit]]
 
-    def _search_secondary_codes(
-        self,
-        good: GoodRecord,
-        query: str,
-        query_alnum: str,
-    ) -> tuple[float, str]:
-        best_score = 0.0
-        best_method = ""
-
-        for cross in good.cross_codes:
-            cross_text = cross.lower()
-            cross_alnum = normalize_code_alnum(cross)
-            if query and query == cross_text:
-                return 0.94, "search_secondary_cross_exact"
-            if query_alnum and query_alnum == cross_alnum:
-                return 0.93, "search_secondary_cross_alnum_exact"
-            if query and query in cross_text and best_score < 0.90:
-                best_score = 0.90
-                best_method = "search_secondary_cross"
-            if query_alnum and query_alnum in cross_alnum and best_score < 0.88:
-                best_score = 0.88
-                best_method = "search_secondary_cross_alnum"
-
-        for barcode in good.barcodes:
-            barcode_text = barcode.lower()
-            barcode_alnum = normalize_code_alnum(barcode)
-            if query and query == barcode_text:
-                return 0.92, "search_secondary_barcode_exact"
-            if query_alnum and query_alnum == barcode_alnum:
-                return 0.91, "search_secondary_barcode_alnum_exact"
-            if query and query in barcode_text and best_score < 0.86:
-                best_score = 0.86
-                best_method = "search_secondary_barcode"
-            if query_alnum and query_alnum in barcode_alnum and best_score < 0.85:
-                best_score = 0.85
-                best_method = "search_secondary_barcode_alnum"
-
-        return best_score, best_method
-
     def apply_manual_good(self, line: InvoiceLine, good_id: int) -> None:
         good = self.catalog.get(good_id)
         if not good:
             raise ValueError(f"Товар с good_id={good_id} не найден в каталоге.")
-        line.raw_data.pop("_sell_initialized", None)
+        line.flags &= ~LINE_FLAG_SELL_INITIALIZED
         cand = self._candidate_from_good(good, "manual", 1.0)
         self._apply_candidate(line, cand, status="manual")
         line.similar_articles = _format_similar_articles([cand])
@@ -287,44 +353,47 @@ class GoodsMatcher:
     def _find_secondary_by_code(self, article: str) -> list[MatchCandidate]:
         barcode = self._find_by_code_source(article, "barcode")
         cross = self._find_by_code_source(article, "cross_code")
-        return _merge_candidates(barcode, cross, limit=10)
+        # Любая оценка по штрихкоду выше любой оценки по кроссу, а оба списка уже
+        # отсортированы: штрихкод выигрывает для общего good_id без сравнения.
+        seen = {cand.good_id for cand in barcode}
+        merged = barcode + [cand for cand in cross if cand.good_id not in seen]
+        return merged[:10]
 
     def _find_by_code_source(self, article: str, source: str, limit: int = 10) -> list[MatchCandidate]:
         article_raw = article.strip()
         if not article_raw:
             return []
 
+        # Точное совпадение (exact_score) всегда выше alnum_score, а при равных оценках
+        # остаётся первый кандидат. Поэтому кандидат создаётся только если он попадёт
+        # в bucket; порядок ключей — по первому появлению good_id, как и раньше.
         bucket: dict[int, MatchCandidate] = {}
+        exact_ids: set[int] = set()
+        catalog = self.catalog
         exact_index, alnum_index = self._indexes_for_source(source)
-        variants = [article_raw] if source == "product_code" else build_article_variants(article_raw)
         exact_score, alnum_score = _scores_for_source(source)
+        exact_method = f"code_exact_{source}"
+        alnum_method = f"code_alnum_{source}"
 
-        for variant in variants:
-            exact_key = normalize_code(variant)
+        for exact_key, alnum_key in _article_code_keys(article_raw, source != "product_code"):
             if exact_key:
-                for entry in exact_index.get(exact_key, []):
-                    good = self.catalog.get(entry.good_id)
+                for good_id in exact_index.get(exact_key, ()):
+                    if good_id in exact_ids:
+                        continue
+                    good = catalog.get(good_id)
                     if not good:
                         continue
-                    cand = self._candidate_from_good(
-                        good,
-                        f"code_exact_{entry.source}",
-                        exact_score,
-                    )
-                    bucket[good.good_id] = _pick_best(bucket.get(good.good_id), cand)
-
-            alnum_key = normalize_code_alnum(variant)
+                    bucket[good_id] = self._candidate_from_good(good, exact_method, exact_score)
+                    exact_ids.add(good_id)
+
             if alnum_key:
-                for entry in alnum_index.get(alnum_key, []):
-                    good = self.catalog.get(entry.good_id)
+                for good_id in alnum_index.get(alnum_key, ()):
+                    if good_id in bucket:
+                        continue
+                    good = catalog.get(good_id)
                     if not good:
                         continue
-                    cand = self._candidate_from_good(
-                        good,
-                        f"code_alnum_{entry.source}",
-                        alnum_score,
-                    )
-                    bucket[good.good_id] = _pick_best(bucket.get(good.good_id), cand)
+                    bucket[good_id] = self._candidate_from_good(good, alnum_method, alnum_score)
 
         out = sorted(bucket.values(), key=lambda x: x.score, reverse=True)
         return out[:limit]
@@ -332,12 +401,9 @@ class GoodsMatcher:
     def _indexes_for_source(
         self,
         source: str,
-    ) -> tuple[dict[str, list[_IndexEntry]], dict[str, list[_IndexEntry]]]:
-        if source == "barcode":
-            return self._barcode_exact_index, self._barcode_alnum_index
-        if source == "cross_code":
-            return self._cross_exact_index, self._cross_alnum_index
-        return self._product_exact_index, self._product_alnum_index
+    ) -> tuple[dict[str, list[int]], dict[str, list[int]]]:
+        indexes = self._ensure_code_indexes()
+        return indexes.get(source, indexes["product_code"])
 
     def _find_by_name(self, name: str, limit: int = 8) -> list[MatchCandidate]:
         target = normalize_name(name)
@@ -347,26 +413,71 @@ class GoodsMatcher:
         if not tokens:
             return []
 
-        candidates: list[tuple[float, MatchCandidate]] = []
-        for good in self.catalog.values():
-            norm_name = self._norm_names.get(good.good_id, "")
-            if not norm_name:
-                continue
-
+        # SequenceMatcher — самая дорогая часть. Сверху ratio ограничен отношением
+        # длин (как real_quick_ratio), поэтому товары, которые заведомо не войдут
+        # в первые limit, пропускаем без него. Результат тот же, что при полном переборе.
+        if limit <= 0:
+            return []
+        # Оцениваем только товары, в названии которых есть хотя бы один токен.
+        positions: set[int] = set()
+        for token in tokens:
+            positions.update(self._positions_with_token(token))
+
+        name_goods = self._ensure_name_index()[0]
+        target_len = len(target)
+        top_scores: list[float] = []  # min-куча лучших limit оценок
+        candidates: list[tuple[float, GoodRecord]] = []
+        ratios: dict[str, float] = {}  # одинаковые названия у разных товаров
+        for pos in sorted(positions):
+            good, norm_name = name_goods[pos]
             token_hits = sum(1 for token in tokens if token in norm_name)
-            if token_hits == 0:
-                continue
 
             hit_score = token_hits / len(tokens)
-            ratio = SequenceMatcher(None, target, norm_name).ratio()
+            ratio = ratios.get(norm_name)
+            if ratio is None:
+                matcher = None
+                if len(top_scores) >= limit:
+                    name_len = len(norm_name)
+                    ratio_bound = 2.0 * min(target_len, name_len) / (target_len + name_len)
+                    if round((hit_score * 0.65) + (ratio_bound * 0.35), 4) < top_scores[0]:
+                        continue
+                    # Вторая, более точная верхняя граница — quick_ratio (по составу символов).
+                    matcher = SequenceMatcher(None, target, norm_name)
+                    if round((hit_score * 0.65) + (matcher.quick_ratio() * 0.35), 4) < top_scores[0]:
+                        continue
+                if matcher is None:
+                    matcher = SequenceMatcher(None, target, norm_name)
+                ratio = ratios[norm_name] = matcher.ratio()
             score = round((hit_score * 0.65) + (ratio * 0.35), 4)
-            method = "name_fuzzy"
-            if score >= 0.92:
-                method = "name_high"
-            candidates.append((score, self._candidate_from_good(good, method, score)))
+            candidates.append((score, good))
+            if len(top_scores) < limit:
+                heapq.heappush(top_scores, score)
+            elif score > top_scores[0]:
+                heapq.heapreplace(top_scores, score)
 
         candidates.sort(key=lambda x: x[0], reverse=True)
-        return [cand for _, cand in candidates[:limit]]
+        out: list[MatchCandidate] = []
+        for score, good in candidates[:limit]:
+            method = "name_high" if score >= 0.92 else "name_fuzzy"
+            out.append(self._candidate_from_good(good, method, score))
+        return out
+
+    def _positions_with_token(self, token: str) -> frozenset[int]:
+        # Токен без пробелов входит в название, только если входит в одно из его слов,
+        # поэтому подстроку ищем по словарю слов, а не по всему каталогу.
+        cache = self._token_positions_cache
+        cached = cache.get(token)
+        if cached is not None:
+            cache.move_to_end(token)
+            return cached
+        found: set[int] = set()
+        for word, word_positions in self._ensure_name_index()[1].items():
+            if token in word:
+                found.update(word_positions)
+        cached = cache[token] = frozenset(found)
+        if len(cache) > _TOKEN_POSITIONS_CACHE_SIZE:
+            cache.popitem(last=False)
+        return cached
 
     def _apply_candidate(self, line: InvoiceLine, candidate: MatchCandidate, status: str) -> None:
         line.matched_good_id = candidate.good_id
@@ -396,8 +507,8 @@ class GoodsMatcher:
 
 def normalize_name(value: str) -> str:
     value = value.lower().strip()
-    value = re.sub(r"[\W_]+", " ", value, flags=re.UNICODE)
-    return re.sub(r"\s+", " ", value).strip()
+    value = _NAME_NONWORD_RE.sub(" ", value)
+    return _SPACES_RE.sub(" ", value).strip()
 
 
 def _looks_like_article_query(value: str) -> bool:
@@ -415,6 +526,60 @@ def _normalize_match_field(value: str) -> str:
     return "product_code"
 
 
+def _reset_unmatched(line: InvoiceLine, *, status: str, method: str, action: str, warning: str) -> None:
+    """Сбрасывает сопоставление строки: товар не выбран, цены — из накладной."""
+    line.match_status = status
+    line.match_method = method
+    line.matched_good_id = None
+    line.matched_name = line.name
+    line.matched_product_code = line.article
+    line.matched_buy_price = None
+    line.existing_sell_price = None
+    line.sell_price = line.price
+    line.suggested_sell_price = None
+    line.sell_price_diff_percent = None
+    line.price_alert = False
+    line.matched_tax_mode = 0
+    line.action = action
+    line.warning = warning
+
+
+def _search_secondary_codes(
+    cross_keys: tuple[tuple[str, str], ...],
+    barcode_keys: tuple[tuple[str, str], ...],
+    query: str,
+    query_alnum: str,
+) -> tuple[float, str]:
+    best_score = 0.0
+    best_method = ""
+
+    for cross_text, cross_alnum in cross_keys:
+        if query and query == cross_text:
+            return 0.94, "search_secondary_cross_exact"
+        if query_alnum and query_alnum == cross_alnum:
+            return 0.93, "search_secondary_cross_alnum_exact"
+        if query and query in cross_text and best_score < 0.90:
+            best_score = 0.90
+            best_method = "search_secondary_cross"
+        if query_alnum and query_alnum in cross_alnum and best_score < 0.88:
+            best_score = 0.88
+            best_method = "search_secondary_cross_alnum"
+
+    for barcode_text, barcode_alnum in barcode_keys:
+        if query and query == barcode_text:
+            return 0.92, "search_secondary_barcode_exact"
+        if query_alnum and query_alnum == barcode_alnum:
+            return 0.91, "search_secondary_barcode_alnum_exact"
+        if query and query in barcode_text and best_score < 0.86:
+            best_score = 0.86
+            best_method = "search_secondary_barcode"
+        if query_alnum and query_alnum in barcode_alnum and best_score < 0.85:
+            best_score = 0.85
+            best_method = "search_secondary_barcode_alnum"
+
+    return best_score, best_method
+
+
 def _scores_for_source(source: str) -> tuple[float, float]:
     if source == "product_code":
         return 1.0, 0.97
@@ -423,27 +588,6 @@ def _scores_for_source(source: str) -> tuple[float, float]:
     return 0.94, 0.90
 
 
-def _pick_best(current: MatchCandidate | None, incoming: MatchCandidate) -> MatchCandidate:
-    if current is None:
-        return incoming
-    if incoming.score > current.score:
-        return incoming
-    return current
-
-
-def _merge_candidates(
-    primary: list[MatchCandidate],
-    secondary: list[MatchCandidate],
-    *,
-    limit: int = 10,
-) -> list[MatchCandidate]:
-    bucket: dict[int, MatchCandidate] = {}
-    for cand in [*primary, *secondary]:
-        bucket[cand.good_id] = _pick_best(bucket.get(cand.good_id), cand)
-    merged = sorted(bucket.values(), key=lambda x: x.score, reverse=True)
-    return merged[:limit]
-
-
 def _format_similar_articles(candidates: list[MatchCandidate], limit: int = 5) -> str:
     if not candidates:
         return ""
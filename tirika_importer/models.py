@@ -19,6 +19,13 @@ class MatchCandidate:
     score: float
 
 
+# Служебные флаги строки накладной (битовая маска InvoiceLine.flags).
+LINE_FLAG_SELL_INITIALIZED = 1  # цена продажи уже инициализирована рекомендованной
+LINE_FLAG_MANUAL_EDITED = 2  # строку правили вручную
+LINE_FLAG_FORCE_UPDATE_SELL_PRICE = 4  # обновить цену продажи в БД для этой строки
+LINE_FLAG_PRICE_APPLIED = 8  # рекомендованная цена применена пользователем
+
+
 @dataclass
 class InvoiceLine:
     line_no: int
@@ -48,6 +55,7 @@ class InvoiceLine:
     similar_articles: str = ""
     matched_tax_mode: int = 0
     candidates: list[MatchCandidate] = field(default_factory=list)
+    flags: int = 0
 
 
 @dataclass
@@ -9,6 +9,7 @@ from io import StringIO
 from pathlib import Path
 from typing import Any
 
+import numpy as np
 import pandas as pd
 
 from .models import InvoiceLine, ParsedInvoice
@@ -24,6 +25,19 @@ CANCEL_NOTE_PATTERNS = (
     r"\bне\s*будет\b",
 )
 
+# Шаблоны, которые применяются к каждой строке/ячейке, компилируются один раз.
+_CANCEL_NOTE_RE = re.compile("|".join(f"(?:{p})" for p in CANCEL_NOTE_PATTERNS), re.IGNORECASE)
+_CANCEL_NO_RE = re.compile(r"[*\s\-_./\\]*no[*\s\-_./\\]*", re.IGNORECASE)
+_TOTAL_MARKER_RE = re.compile(r"^итог(?:о)?\s*:?")
+_NON_ALNUM_RE = re.compile(r"[^0-9a-zа-я]+")
+_REMOVED_FROM_ORDER_RE = re.compile(r"\bудален\w*\s+из\s+заказ", re.IGNORECASE)
+_NUMBER_ONLY_RE = re.compile(r"\d+(?:\.\d+)?")
+_DECIMAL_RE = re.compile(r"[0-9]+[.,][0-9]+")
+_TRAILING_ZEROS_RE = re.compile(r"[0-9]+\.0+")
+_MIKADO_PREFIX_RE = re.compile(r"^(xmil|xzk)\s*[-_ ]*", re.IGNORECASE)
+_ARTICLE_SEPARATORS_RE = re.compile(r"[\s\-]+")
+_FLOAT_TEXT_TRANS = str.maketrans({" ": None, ",": "."})
+
 try:
     import pythoncom  # type: ignore[import-not-found]
     import win32com.client  # type: ignore[import-not-found]
@@ -55,6 +69,17 @@ def _excel_com_session():
             pythoncom.CoUninitialize()
 
 
+def _com_sheet_values(sheet: Any, rows: int, cols: int) -> list[list[Any]]:
+    """Значения ячеек A1..(rows, cols) одним вызовом COM вместо Cells(r, c) на каждую ячейку."""
+    if rows <= 0 or cols <= 0:
+        return []
+    data = sheet.Range(sheet.Cells(1, 1), sheet.Cells(rows, cols)).Value
+    if not isinstance(data, tuple):
+        # Диапазон из одной ячейки Excel отдаёт скаляром.
+        return [[data]]
+    return [list(row) for row in data]
+
+
 def parse_invoice_file(path: Path) -> ParsedInvoice:
     if not path.exists():
         raise InvoiceParseError(f"Файл не найден: {path}")
@@ -81,7 +106,9 @@ def _looks_like_html(path: Path) -> bool:
 def _parse_mikado_html(path: Path) -> ParsedInvoice:
     text = path.read_text(encoding="cp1251", errors="ignore")
     try:
-        tables = pd.read_html(StringIO(text))
+        # Только lxml: без flavor pandas после неудачи lxml пробует bs4/html5lib,
+        # которых нет в сборке, и вместо ValueError падает с ImportError.
+        tables = pd.read_html(StringIO(text), flavor="lxml")
     except ValueError as exc:
         raise InvoiceParseError(f"Не удалось разобрать HTML-накладную: {exc}") from exc
 
@@ -105,21 +132,26 @@ def _parse_mikado_html(path: Path) -> ParsedInvoice:
 
     invoice_number, invoice_date = _extract_invoice_header(text)
 
+    # Кортежи значений вместо df.iterrows(): без построения Series на каждую строку.
+    keys = list(df.columns)
     lines: list[InvoiceLine] = []
-    for idx, row in df.iterrows():
-        if _row_has_total_marker(row.tolist()) or _row_has_service_marker(row.tolist()):
+    for values in df.itertuples(index=False, name=None):
+        cells = list(values)
+        # Текст ячеек чистится один раз на строку (_clean_text идемпотентна).
+        texts = list(map(_clean_text, cells))
+        if _row_has_total_marker(texts) or _row_has_service_marker(texts):
             continue
-        article = _clean_article(row.iloc[code_col], source_type="mikado_html")
-        name = _clean_text(row.iloc[name_col]) if name_col is not None else ""
-        note = _extract_note_from_row(row.tolist(), note_cols)
+        article = _clean_article(cells[code_col], source_type="mikado_html")
         if not article or "итого" in article.lower():
             continue
         if not _looks_like_article(article):
             continue
+        name = texts[name_col] if name_col is not None else ""
+        note = _extract_note_from_row(texts, note_cols)
 
-        qty = _to_float(row.iloc[qty_col])
-        price = _to_float(row.iloc[price_col])
-        raw_total_value = row.iloc[sum_col] if sum_col is not None else None
+        qty = _to_float(cells[qty_col])
+        price = _to_float(cells[price_col])
+        raw_total_value = cells[sum_col] if sum_col is not None else None
         total = _to_float(raw_total_value) if sum_col is not None else round(qty * price, 2)
 
         line = InvoiceLine(
@@ -131,7 +163,7 @@ def _parse_mikado_html(path: Path) -> ParsedInvoice:
             price=price,
             total=total,
             source_supplier="МИКАДО",
-            raw_data={k: _clean_text(v) for k, v in row.to_dict().items()},
+            raw_data=dict(zip(keys, texts)),
         )
         _mark_line_cancelled_if_needed(line, raw_total_value=raw_total_value)
         lines.append(line)
@@ -451,22 +483,9 @@ def _read_excel_table_via_com(path: Path) -> ParsedTable:
                 rows = used.Rows.Count
                 cols = used.Columns.Count
 
-                headers: list[str] = []
-                raw_rows: list[list[Any]] = []
-
-                for c in range(1, cols + 1):
-                    headers.append(_clean_text(sheet.Cells(1, c).Value))
-
-                for r in range(2, rows + 1):
-                    row: list[Any] = []
-                    non_empty = False
-                    for c in range(1, cols + 1):
-                        val = sheet.Cells(r, c).Value
-                        row.append(val)
-                        if val not in (None, ""):
-                            non_empty = True
-                    if non_empty:
-                        raw_rows.append(row)
+                data = _com_sheet_values(sheet, rows, cols)
+                headers = [_clean_text(val) for val in data[0]] if data else []
+                raw_rows = [row for row in data[1:] if any(val not in (None, "") for val in row)]
                 return ParsedTable(headers=headers, rows=raw_rows)
             finally:
                 if workbook is not None:
@@ -497,17 +516,11 @@ def _read_excel_matrix_via_com(path: Path) -> list[list[Any]]:
                 rows_count = used.Rows.Count
                 cols_count = used.Columns.Count
 
-                matrix: list[list[Any]] = []
-                for r in range(1, rows_count + 1):
-                    row: list[Any] = []
-                    has_data = False
-                    for c in range(1, cols_count + 1):
-                        val = sheet.Cells(r, c).Value
-                        row.append(val)
-                        if _clean_text(val):
-                            has_data = True
-                    if has_data:
-                        matrix.append(row)
+                matrix = [
+                    row
+                    for row in _com_sheet_values(sheet, rows_count, cols_count)
+                    if any(_clean_text(val) for val in row)
+                ]
                 return matrix
             finally:
                 if workbook is not None:
@@ -624,9 +637,9 @@ def _is_cancel_note(note: str) -> bool:
     if not note:
         return False
     low = note.lower().replace("ё", "е").strip()
-    if re.fullmatch(r"[*\s\-_./\\]*no[*\s\-_./\\]*", low, flags=re.IGNORECASE):
+    if _CANCEL_NO_RE.fullmatch(low):
         return True
-    return any(re.search(pattern, low, flags=re.IGNORECASE) for pattern in CANCEL_NOTE_PATTERNS)
+    return _CANCEL_NOTE_RE.search(low) is not None
 
 
 def _is_cancel_total_marker(value: Any) -> bool:
@@ -647,7 +660,7 @@ def _row_has_total_marker(row: list[Any]) -> bool:
         text = _clean_text(value).lower()
         if not text:
             continue
-        if re.match(r"^итог(?:о)?\s*:?", text):
+        if _TOTAL_MARKER_RE.match(text):
             return True
     return False
 
@@ -666,9 +679,9 @@ def _row_has_service_marker(row: list[Any]) -> bool:
 
 def _is_service_marker_text(text: str) -> bool:
     low = text.lower().replace("ё", "е").strip()
-    compact = re.sub(r"[^0-9a-zа-я]+", "", low)
+    compact = _NON_ALNUM_RE.sub("", low)
     return bool(
-        re.search(r"\bудален\w*\s+из\s+заказ", low, flags=re.IGNORECASE)
+        _REMOVED_FROM_ORDER_RE.search(low)
         or "удаленоиззаказ" in compact
     )
 
@@ -678,7 +691,7 @@ def _is_structure_only_text(text: str) -> bool:
     if low in {"*", "-", "—", "–"}:
         return True
     compact = low.replace(" ", "").replace(",", ".")
-    return bool(re.fullmatch(r"\d+(?:\.\d+)?", compact))
+    return bool(_NUMBER_ONLY_RE.fullmatch(compact))
 
 
 def _extract_invoice_header(text: str) -> tuple[str, datetime | None]:
@@ -710,8 +723,9 @@ def _extract_invoice_header(text: str) -> tuple[str, datetime | None]:
 def _clean_text(value: Any) -> str:
     if value is None:
         return ""
-    text = str(value).replace("\xa0", " ").strip()
-    if text.lower() == "nan":
+    text = (value if type(value) is str else str(value)).replace("\xa0", " ").strip()
+    # lower() копирует всю строку — проверяем «nan» только у строк длины 3.
+    if len(text) == 3 and text.lower() == "nan":
         return ""
     return text
 
@@ -719,12 +733,14 @@ def _clean_text(value: Any) -> str:
 def _to_float(value: Any) -> float:
     if value is None:
         return 0.0
-    if isinstance(value, (int, float)):
+    # numpy.float64 — подкласс float; целые numpy (int64 из read_excel) — нет.
+    # float32 сюда не берём: float() даст иное значение, чем разбор str(value).
+    if isinstance(value, (int, float, np.integer)):
         return float(value)
     text = _clean_text(value)
     if not text:
         return 0.0
-    text = text.replace(" ", "").replace(",", ".")
+    text = text.translate(_FLOAT_TEXT_TRANS)
     try:
         return float(text)
     except ValueError:
@@ -737,7 +753,7 @@ def _looks_like_article(article: str) -> bool:
         return False
     if clean.startswith("итого"):
         return False
-    if re.fullmatch(r"[0-9]+[.,][0-9]+", clean):
+    if _DECIMAL_RE.fullmatch(clean):
         return False
     return True
 
@@ -756,8 +772,10 @@ def _fix_mojibake(text: str) -> str:
 def _clean_article(value: Any, *, source_type: str = "") -> str:
     if isinstance(value, float) and value.is_integer():
         return _normalize_article(str(int(value)), source_type=source_type)
+    if isinstance(value, (int, np.integer)) and not isinstance(value, bool):
+        return _normalize_article(str(value), source_type=source_type)
     text = _clean_text(value)
-    if re.fullmatch(r"[0-9]+\.0+", text):
+    if _TRAILING_ZEROS_RE.fullmatch(text):
         text = text.split(".", 1)[0]
     return _normalize_article(text, source_type=source_type)
 
@@ -772,8 +790,8 @@ def _normalize_article(value: str, *, source_type: str = "") -> str:
         if "-" in text:
             text = text.split("-", 1)[1]
     # Legacy known Mikado prefixes.
-    text = re.sub(r"^(xmil|xzk)\s*[-_ ]*", "", text, flags=re.IGNORECASE)
+    text = _MIKADO_PREFIX_RE.sub("", text)
     text = text.replace("\t", "")
-    text = re.sub(r"[\s\-]+", "", text)
+    text = _ARTICLE_SEPARATORS_RE.sub("", text)
     return text.upper()
 
@@ -8,6 +8,7 @@ try:
         QDate,
         QEvent,
         QObject,
+        QSignalBlocker,
         QSize,
         QStringListModel,
         QThread,
@@ -15,7 +16,7 @@ try:
         Qt,
         Signal,
     )
-    from PySide6.QtGui import QColor, QFontMetrics, QIcon, QPainter, QPalette, QPen, QPixmap
+    from PySide6.QtGui import QColor, QFont, QFontMetrics, QIcon, QPainter, QPalette, QPen, QPixmap
     from PySide6.QtSvgWidgets import QSvgWidget
     from PySide6.QtWidgets import (
         QAbstractItemView,
@@ -65,6 +66,7 @@ except Exception:
         QDate,
         QEvent,
         QObject,
+        QSignalBlocker,
         QSize,
         QStringListModel,
         QThread,
@@ -72,7 +74,7 @@ except Exception:
         Qt,
         Signal,
     )
-    from PySide2.QtGui import QColor, QFontMetrics, QIcon, QPainter, QPalette, QPen, QPixmap
+    from PySide2.QtGui import QColor, QFont, QFontMetrics, QIcon, QPainter, QPalette, QPen, QPixmap
     from PySide2.QtSvg import QSvgWidget
     from PySide2.QtWidgets import (
         QAbstractItemView,
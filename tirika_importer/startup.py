@@ -2,6 +2,7 @@ from __future__ import annotations
 
 import os
 import sys
+from functools import lru_cache
 from pathlib import Path
 
 try:
@@ -9,6 +10,13 @@ try:
 except Exception:  # pragma: no cover
     win32com = None  # type: ignore[assignment]
 
+try:
+    import pythoncom  # type: ignore[import-not-found]
+    from win32com.shell import shell as win32_shell  # type: ignore[import-not-found]
+except Exception:  # pragma: no cover
+    pythoncom = None  # type: ignore[assignment]
+    win32_shell = None  # type: ignore[assignment]
+
 
 class StartupError(RuntimeError):
     pass
@@ -21,6 +29,7 @@ def is_supported() -> bool:
     return os.name == "nt" and win32com is not None
 
 
+@lru_cache(maxsize=1)  # APPDATA не меняется в рамках сеанса Windows
 def get_startup_link_path() -> Path:
     startup_dir = (
         Path(os.environ.get("APPDATA", ""))
@@ -45,6 +54,10 @@ def enable_startup() -> Path:
     link_path = get_startup_link_path()
     link_path.parent.mkdir(parents=True, exist_ok=True)
 
+    if pythoncom is not None and win32_shell is not None:
+        _create_shell_link(link_path, target_path, args, workdir)
+        return link_path
+
     shell = win32com.client.Dispatch("WScript.Shell")  # type: ignore[union-attr]
     shortcut = shell.CreateShortCut(str(link_path))
     shortcut.TargetPath = str(target_path)
@@ -56,12 +69,29 @@ def enable_startup() -> Path:
     return link_path
 
 
+def _create_shell_link(link_path: Path, target_path: Path, args: str, workdir: Path) -> None:
+    # IShellLinkW напрямую, без позднего связывания через WScript.Shell (IDispatch).
+    link = pythoncom.CoCreateInstance(  # type: ignore[union-attr]
+        win32_shell.CLSID_ShellLink,  # type: ignore[union-attr]
+        None,
+        pythoncom.CLSCTX_INPROC_SERVER,  # type: ignore[union-attr]
+        win32_shell.IID_IShellLink,  # type: ignore[union-attr]
+    )
+    link.SetPath(str(target_path))
+    link.SetArguments(args)
+    link.SetWorkingDirectory(str(workdir))
+    link.SetShowCmd(1)  # SW_SHOWNORMAL
+    link.SetIconLocation(str(target_path), 0)
+    link.QueryInterface(pythoncom.IID_IPersistFile).Save(str(link_path), 0)  # type: ignore[union-attr]
+
+
 def disable_startup() -> None:
     link_path = get_startup_link_path()
     if link_path.exists():
         link_path.unlink()
 
 
+@lru_cache(maxsize=1)  # расположение exe/main.py не меняется во время работы
 def _resolve_launch_command() -> tuple[Path, str, Path]:
     if getattr(sys, "frozen", False):
         exe = Path(sys.executable).resolve()
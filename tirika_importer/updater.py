@@ -2,15 +2,20 @@
 
 import base64
 import hashlib
+import hmac
 import json
+import mmap
+import os
 import tempfile
 import re
 import subprocess
 import time
-from dataclasses import dataclass
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import asdict, dataclass
 from pathlib import Path
-from typing import Callable
-from urllib.parse import urljoin, urlparse
+from typing import BinaryIO, Callable
+from urllib.error import HTTPError
+from urllib.parse import urljoin, urlsplit
 from urllib.request import Request, urlopen
 
 
@@ -27,13 +32,30 @@ class UpdateInfo:
     release_page_url: str = ""
 
 
+# Результат автоматической проверки обновлений переиспользуется в течение этого срока.
+UPDATE_CHECK_TTL_SEC = 6 * 60 * 60
+UPDATE_CHECK_CACHE_NAME = "update_check.json"
+
+# Размер блока чтения/записи при скачивании установщика.
+_DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+# До этого размера sha256_file (без hashlib.file_digest) хеширует файл через mmap.
+_MMAP_HASH_LIMIT = 256 * 1024 * 1024
+
+_VERSION_NUMBER_RE = re.compile(r"\d+")
+
 # Установщик принимаем только с доверенных хостов по HTTPS (цепочка релизов на GitHub).
 _TRUSTED_HOST_SUFFIXES = ("github.com", "githubusercontent.com")
 
+# URL manifest -> (ETag, Last-Modified, разобранный manifest) последнего ответа 200.
+# Повторная проверка в том же сеансе шлёт условный запрос и на 304 берёт manifest
+# отсюда (к тому же условные запросы не расходуют лимит GitHub API).
+_MANIFEST_CACHE: dict[str, tuple[str | None, str | None, dict[str, object]]] = {}
+
 
 def _is_trusted_installer_url(url: str) -> bool:
     try:
-        parsed = urlparse(url)
+        parsed = urlsplit(url)
     except Exception:
         return False
     if parsed.scheme.lower() != "https":
@@ -47,14 +69,20 @@ def _is_valid_sha256(value: str) -> bool:
     return len(v) == 64 and all(c in "0123456789abcdef" for c in v)
 
 
+def _manifest_field(manifest: dict[str, object], key: str) -> str:
+    value = manifest.get(key, "")
+    # json.loads почти всегда отдаёт str — без лишнего str(...).
+    return (value if isinstance(value, str) else str(value)).strip()
+
+
 def check_for_update(current_version: str, manifest_url: str, timeout_sec: float = 20.0) -> UpdateInfo | None:
     url = manifest_url.strip()
     if not url:
         return None
 
     manifest = _fetch_manifest(url, timeout_sec=timeout_sec)
-    version = str(manifest.get("version", "")).strip()
-    installer_url_raw = str(manifest.get("url", "")).strip()
+    version = _manifest_field(manifest, "version")
+    installer_url_raw = _manifest_field(manifest, "url")
     if not version or not installer_url_raw:
         raise UpdateError("В manifest нет обязательных полей: version и url.")
 
@@ -64,7 +92,7 @@ def check_for_update(current_version: str, manifest_url: str, timeout_sec: float
             "URL установщика не на доверенном хосте (ожидается github.com / "
             f"githubusercontent.com по HTTPS): {installer_url}"
         )
-    sha256 = str(manifest.get("sha256", "")).strip().lower()
+    sha256 = _manifest_field(manifest, "sha256").lower()
     if not _is_valid_sha256(sha256):
         raise UpdateError(
             "В manifest нет корректного sha256 установщика — обновление отклонено "
@@ -74,65 +102,197 @@ def check_for_update(current_version: str, manifest_url: str, timeout_sec: float
         version=version,
         installer_url=installer_url,
         sha256=sha256,
-        notes=str(manifest.get("notes", "")).strip(),
-        release_page_url=str(manifest.get("release_page_url", "")).strip(),
+        notes=_manifest_field(manifest, "notes"),
+        release_page_url=_manifest_field(manifest, "release_page_url"),
     )
     if not is_newer_version(info.version, current_version):
         return None
     return info
 
 
+def load_cached_update_check(
+    cache_path: Path,
+    manifest_url: str,
+    current_version: str,
+    *,
+    ttl_sec: float = UPDATE_CHECK_TTL_SEC,
+    now: float | None = None,
+) -> tuple[bool, UpdateInfo | None]:
+    """Возвращает (найден ли свежий результат, обновление или None)."""
+    try:
+        raw = json.loads(cache_path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return False, None
+    if not isinstance(raw, dict):
+        return False, None
+    if raw.get("manifest_url") != manifest_url or raw.get("current_version") != current_version:
+        return False, None
+    try:
+        checked_at = float(raw.get("checked_at", 0))
+    except (TypeError, ValueError):
+        return False, None
+    age = (time.time() if now is None else now) - checked_at
+    if not 0 <= age < ttl_sec:
+        return False, None
+
+    payload = raw.get("update")
+    if payload is None:
+        return True, None
+    if not isinstance(payload, dict):
+        return False, None
+    try:
+        info = UpdateInfo(**payload)
+    except TypeError:
+        return False, None
+    # Кэш лежит на диске: повторяем те же проверки, что и для свежего manifest.
+    if not _is_trusted_installer_url(info.installer_url) or not _is_valid_sha256(info.sha256):
+        return False, None
+    if not is_newer_version(info.version, current_version):
+        return True, None
+    return True, info
+
+
+def save_update_check(
+    cache_path: Path,
+    manifest_url: str,
+    current_version: str,
+    update: UpdateInfo | None,
+    *,
+    now: float | None = None,
+) -> None:
+    payload = {
+        "manifest_url": manifest_url,
+        "current_version": current_version,
+        "checked_at": time.time() if now is None else now,
+        "update": asdict(update) if update is not None else None,
+    }
+    try:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = cache_path.with_name(cache_path.name + ".tmp")
+        tmp_path.write_text(json.dumps(payload, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        # Кэш необязателен: при ошибке записи просто проверим обновления в следующий раз.
+        pass
+
+
 def download_installer(
     update: UpdateInfo,
     target_dir: Path,
     timeout_sec: float = 90.0,
     progress_cb: Callable[[int, int], None] | None = None,
 ) -> Path:
+    # Без корректного sha256 установщик всё равно будет отклонён — не качаем его зря.
+    if not _is_valid_sha256(update.sha256):
+        raise UpdateError("Обновление без корректного sha256 отклонено в целях безопасности.")
+    expected_sha256 = update.sha256.strip().lower()
     target_dir.mkdir(parents=True, exist_ok=True)
     name = _installer_filename(update)
     final_path = target_dir / name
     temp_path = target_dir / f"{name}.part"
 
+    # Установщик уже скачан прошлым запуском и совпадает по sha256 — сеть не нужна.
+    if final_path.is_file() and hmac.compare_digest(sha256_file(final_path), expected_sha256):
+        if progress_cb is not None:
+            size = final_path.stat().st_size
+            progress_cb(size, size)
+        return final_path
+
     last_exc: Exception | None = None
+    # Два буфера на всё скачивание (readinto): в один читаем из сети,
+    # другой в это время хеширует поток hasher (hashlib отпускает GIL).
+    bufs = (bytearray(_DOWNLOAD_CHUNK_SIZE), bytearray(_DOWNLOAD_CHUNK_SIZE))
+    buf = bufs[0]
+    view = memoryview(buf)
     for attempt in range(1, 4):
-        req = Request(update.installer_url, headers={"User-Agent": "Dazzle-Updater/1.0"})
+        headers = {"User-Agent": "Dazzle-Updater/1.0"}
+        # SHA256 считаем по ходу скачивания, без повторного чтения файла с диска.
+        digest = hashlib.sha256()
+        start = 0
         try:
-            with urlopen(req, timeout=timeout_sec) as resp, temp_path.open("wb") as out:
-                total_raw = resp.headers.get("Content-Length", "").strip()
-                total_bytes = int(total_raw) if total_raw.isdigit() else 0
-                downloaded = 0
-                if progress_cb is not None:
-                    progress_cb(0, total_bytes)
-                while True:
-                    chunk = resp.read(1024 * 256)
-                    if not chunk:
-                        break
-                    out.write(chunk)
-                    downloaded += len(chunk)
+            # Недокачанный .part (обрыв связи, прошлый запуск) докачиваем через Range:
+            # уже записанные байты только прогоняем через SHA256.
+            try:
+                start = temp_path.stat().st_size if temp_path.is_file() else 0
+                if start:
+                    with temp_path.open("rb") as part:
+                        while True:
+                            size = part.readinto(buf)
+                            if not size:
+                                break
+                            digest.update(view[:size])
+            except OSError:
+                # .part не читается (заблокирован антивирусом, нет прав) — качаем целиком.
+                start = 0
+                digest = hashlib.sha256()
+                temp_path.unlink(missing_ok=True)
+            if start:
+                headers["Range"] = f"bytes={start}-"
+            req = Request(update.installer_url, headers=headers)
+            with urlopen(req, timeout=timeout_sec) as resp:
+                if start and getattr(resp, "status", None) != 206:
+                    # Сервер не поддержал Range и отдаёт файл целиком.
+                    start = 0
+                    digest = hashlib.sha256()
+                with temp_path.open("r+b" if start else "wb") as out:
+                    out.seek(start)
+                    total_raw = resp.headers.get("Content-Length", "").strip()
+                    total_bytes = start + int(total_raw) if total_raw.isdigit() else 0
+                    downloaded = start
                     if progress_cb is not None:
                         progress_cb(downloaded, total_bytes)
-            last_exc = None
-            break
+                    try:
+                        _preallocate(out, total_bytes)
+                        with ThreadPoolExecutor(max_workers=1) as hasher:
+                            pending: Future[None] | None = None
+                            index = 0
+                            while True:
+                                # Предыдущий буфер ещё может хешироваться — читаем в другой.
+                                size = resp.readinto(bufs[index])
+                                if not size:
+                                    break
+                                chunk = memoryview(bufs[index])[:size]
+                                out.write(chunk)
+                                downloaded += size
+                                if pending is not None:
+                                    pending.result()
+                                pending = hasher.submit(digest.update, chunk)
+                                index ^= 1
+                                if progress_cb is not None:
+                                    progress_cb(downloaded, total_bytes)
+                            if pending is not None:
+                                pending.result()
+                        if downloaded < total_bytes:
+                            # http.client не считает обрыв до Content-Length ошибкой —
+                            # иначе докачка из .part на следующей попытке не сработает.
+                            raise UpdateError(
+                                f"Соединение оборвалось: получено {downloaded} из {total_bytes} байт."
+                            )
+                    finally:
+                        # Зарезервированный, но не записанный хвост отрезаем: по размеру .part
+                        # следующая попытка решает, с какого байта докачивать.
+                        out.truncate(downloaded)
         except Exception as exc:
             last_exc = exc
-            if temp_path.exists():
+            if isinstance(exc, HTTPError) and exc.code == 416:
+                # .part не короче файла на сервере — он устарел, качаем заново.
                 temp_path.unlink(missing_ok=True)
             if attempt < 3:
                 time.sleep(1.2 * attempt)
-                continue
-    if last_exc is not None:
-        raise UpdateError(f"Не удалось скачать обновление: {last_exc}") from last_exc
+            continue
 
-    if not _is_valid_sha256(update.sha256):
-        temp_path.unlink(missing_ok=True)
-        raise UpdateError("Обновление без корректного sha256 отклонено в целях безопасности.")
-    actual = sha256_file(temp_path)
-    if actual.lower() != update.sha256.lower():
+        actual = digest.hexdigest()
+        if hmac.compare_digest(actual, expected_sha256):
+            break
         temp_path.unlink(missing_ok=True)
-        raise UpdateError(
-            "Проверка SHA256 не пройдена. "
-            f"Ожидался: {update.sha256}, получен: {actual}."
-        )
+        if not start or attempt == 3:
+            raise UpdateError(
+                "Проверка SHA256 не пройдена. "
+                f"Ожидался: {update.sha256}, получен: {actual}."
+            )
+        # Докачивали устаревший .part (например, от другой версии) — заново целиком.
+    else:
+        raise UpdateError(f"Не удалось скачать обновление: {last_exc}") from last_exc
 
     if final_path.exists():
         final_path.unlink(missing_ok=True)
@@ -140,6 +300,20 @@ def download_installer(
     return final_path
 
 
+def _preallocate(out: BinaryIO, size: int) -> None:
+    # Место под весь установщик резервируем одним вызовом: меньше фрагментации
+    # и обновлений метаданных ФС, чем при росте файла на каждом write().
+    if size <= out.tell():
+        return
+    try:
+        if hasattr(os, "posix_fallocate"):
+            os.posix_fallocate(out.fileno(), 0, size)
+        else:
+            out.truncate(size)  # Windows: SetEndOfFile, позиция записи не меняется
+    except OSError:
+        pass  # резерв — лишь подсказка ФС, без него скачивание работает как раньше
+
+
 def run_installer(
     installer_path: Path,
     *,
@@ -151,7 +325,7 @@ def run_installer(
     try:
         args = _installer_args(installer_path)
         if relaunch_executable is None:
-            subprocess.Popen(args)
+            subprocess.Popen(args, **_detached_popen_kwargs())
             return
 
         _run_installer_with_relaunch(args, relaunch_executable)
@@ -160,8 +334,17 @@ def run_installer(
 
 
 def sha256_file(path: Path) -> str:
-    h = hashlib.sha256()
+    if hasattr(hashlib, "file_digest"):  # Python 3.11+: цикл чтения и хеширования в C
+        with path.open("rb", buffering=0) as f:
+            return hashlib.file_digest(f, "sha256").hexdigest()
+    h = hashlib.sha256()  # Python 3.8 (сборка для Win7)
     with path.open("rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if 0 < size <= _MMAP_HASH_LIMIT:
+            # Весь файл одним update(): без цикла чтения на уровне Python.
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                h.update(mm)
+            return h.hexdigest()
         while True:
             block = f.read(1024 * 1024)
             if not block:
@@ -171,6 +354,8 @@ def sha256_file(path: Path) -> str:
 
 
 def is_newer_version(candidate: str, current: str) -> bool:
+    if candidate == current:
+        return False
     a = _version_tuple(candidate)
     b = _version_tuple(current)
     width = max(len(a), len(b))
@@ -180,15 +365,15 @@ def is_newer_version(candidate: str, current: str) -> bool:
 
 
 def _version_tuple(value: str) -> tuple[int, ...]:
-    parts = re.findall(r"\d+", value)
+    parts = _VERSION_NUMBER_RE.findall(value)
     if not parts:
         return (0,)
-    out = tuple(int(x) for x in parts)
-    return out
+    return tuple(map(int, parts))
 
 
 def _installer_filename(update: UpdateInfo) -> str:
-    parsed = urlparse(update.installer_url)
+    # Тот же URL уже разбирали urljoin/_is_trusted_installer_url: urlsplit берёт его из кеша.
+    parsed = urlsplit(update.installer_url)
     name = Path(parsed.path).name.strip()
     if name.lower().endswith(".exe") and name:
         return name
@@ -200,13 +385,30 @@ def _fetch_manifest(manifest_url: str, timeout_sec: float) -> dict[str, object]:
     last_exc: Exception | None = None
     for url in urls:
         for attempt in range(1, 4):
-            req = Request(url, headers={"User-Agent": "Dazzle-Updater/1.0"})
+            headers = {"User-Agent": "Dazzle-Updater/1.0"}
+            cached = _MANIFEST_CACHE.get(url)
+            if cached is not None:
+                etag, last_modified, _raw = cached
+                if etag:
+                    headers["If-None-Match"] = etag
+                if last_modified:
+                    headers["If-Modified-Since"] = last_modified
+            req = Request(url, headers=headers)
             try:
-                with urlopen(req, timeout=timeout_sec) as resp:
-                    payload = resp.read().decode("utf-8-sig")
+                try:
+                    with urlopen(req, timeout=timeout_sec) as resp:
+                        payload = resp.read().decode("utf-8-sig")
+                        etag = resp.headers.get("ETag")
+                        last_modified = resp.headers.get("Last-Modified")
+                except HTTPError as exc:
+                    if exc.code == 304 and cached is not None:
+                        return dict(cached[2])
+                    raise
                 raw = _parse_manifest_payload(payload)
                 if not isinstance(raw, dict):
                     raise UpdateError("Manifest должен быть JSON-объектом.")
+                if etag or last_modified:
+                    _MANIFEST_CACHE[url] = (etag, last_modified, dict(raw))
                 return raw
             except Exception as exc:
                 last_exc = exc
@@ -250,7 +452,7 @@ def _manifest_candidate_urls(manifest_url: str) -> list[str]:
             out.append(c)
 
     add(url)
-    parsed = urlparse(url)
+    parsed = urlsplit(url)
     host = parsed.netloc.lower()
     path = parsed.path.strip("/")
 
@@ -301,11 +503,21 @@ def _run_installer_with_relaunch(installer_args: list[str], relaunch_executable:
     )
     script_path.write_text(script, encoding="cp1251", errors="ignore")
 
+    subprocess.Popen(["cmd.exe", "/c", str(script_path)], **_detached_popen_kwargs())
+
+
+def _detached_popen_kwargs() -> dict[str, object]:
+    # Отдельный процесс без консоли и унаследованных дескрипторов; окно скрыто
+    # с самого старта (STARTF_USESHOWWINDOW + SW_HIDE), чтобы не мелькала консоль.
     creation_flags = 0
     creation_flags |= int(getattr(subprocess, "CREATE_NO_WINDOW", 0))
     creation_flags |= int(getattr(subprocess, "DETACHED_PROCESS", 0))
-    subprocess.Popen(
-        ["cmd.exe", "/c", str(script_path)],
-        creationflags=creation_flags,
-    )
+    kwargs: dict[str, object] = {"creationflags": creation_flags, "close_fds": True}
+    startupinfo_cls = getattr(subprocess, "STARTUPINFO", None)
+    if startupinfo_cls is not None:  # только Windows
+        startupinfo = startupinfo_cls()
+        startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+        startupinfo.wShowWindow = subprocess.SW_HIDE
+        kwargs["startupinfo"] = startupinfo
+    return kwargs
 
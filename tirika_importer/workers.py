@@ -57,9 +57,7 @@ class DbOpenWorker(QObject):
     def run(self) -> None:
         try:
             db = TirikaDB(self._db_path)
-            suppliers = db.list_suppliers()
-            users = db.list_users()
-            shops = db.list_shops()
+            suppliers, users, shops = db.list_reference_data()
             shop_ids = {int(sid) for sid, _ in shops}
             if self._shop_id in shop_ids:
                 effective_shop_id = self._shop_id